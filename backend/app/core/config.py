@@ -1,3 +1,5 @@
+import json
+import os
 from pathlib import Path
 
 # 업로드 파일 저장 위치 (프로젝트 내 backend/uploads)
@@ -9,3 +11,40 @@ ALLOWED_EXTENSIONS = {".pdf", ".docx", ".txt"}
 
 # 파일 최대 크기(선택): FastAPI 자체 제한은 없고, 운영 환경에서 Nginx 등으로 제한하는 경우가 많음
 MAX_FILE_SIZE_MB = 500
+
+# 요청 트레이스를 JSONL로 남길 파일 경로 (비우면 기록하지 않음)
+TRACE_FILE = os.getenv("SIFT_TRACE_FILE") or None
+
+# num_predict 자동 조정: 꺼져 있어도 관측은 계속 쌓이고, 켜면 학습된 예산을 사용
+NUM_PREDICT_AUTO = os.getenv("SIFT_NUM_PREDICT_AUTO", "0") == "1"
+NUM_PREDICT_TARGET_RATE = float(os.getenv("SIFT_NUM_PREDICT_TARGET_RATE", "0.95"))
+NUM_PREDICT_TUNER_FILE = BASE_DIR / "data" / "num_predict_tuning.json"
+
+# 요약 결과 저장소 (sqlite:///경로 또는 등록된 다른 백엔드 URL)
+SUMMARY_DB_URL = os.getenv("SIFT_SUMMARY_DB_URL") or f"sqlite://{(BASE_DIR / 'data' / 'summaries.db').as_posix()}"
+SUMMARY_DB_POOL_SIZE = int(os.getenv("SIFT_SUMMARY_DB_POOL_SIZE", "4"))
+# 추가 저장소 백엔드 모듈 (import 시 register_backend 호출), 예: "sift_oracle.repository"
+SUMMARY_DB_BACKENDS = tuple(m.strip() for m in os.getenv("SIFT_SUMMARY_DB_BACKENDS", "").split(",") if m.strip())
+
+# map 청크 마이크로 배칭: 짧은 시간 창에 모인 청크를 한 프롬프트로 묶어 요약
+MAP_BATCHING = os.getenv("SIFT_MAP_BATCHING", "0") == "1"
+MAP_BATCH_WINDOW_MS = int(os.getenv("SIFT_MAP_BATCH_WINDOW_MS", "15"))
+MAP_BATCH_MAX_SECTIONS = int(os.getenv("SIFT_MAP_BATCH_MAX_SECTIONS", "4"))
+MAP_BATCH_MAX_CHARS = int(os.getenv("SIFT_MAP_BATCH_MAX_CHARS", "2400"))
+
+# Ollama 호출 기록 (replay 도구용). 디렉터리를 지정해야 켜짐
+RECORD_DIR = Path(os.environ["SIFT_RECORD_DIR"]) if os.getenv("SIFT_RECORD_DIR") else None
+RECORD_FULL_PROMPT = os.getenv("SIFT_RECORD_FULL_PROMPT", "0") == "1"
+RECORD_MAX_PER_FILE = int(os.getenv("SIFT_RECORD_MAX_PER_FILE", "5000"))
+
+# 모드별 모델 캐스케이드 (JSON). 예: {"news": {"small": "gemma3:1b", "max_small_chars": 3000}}
+CASCADE = json.loads(os.getenv("SIFT_CASCADE") or "{}")
+
+# Ollama 연결 설정
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+OLLAMA_UDS = os.getenv("OLLAMA_UDS") or None          # 예: /run/ollama.sock (같은 호스트일 때)
+OLLAMA_HTTP2 = os.getenv("OLLAMA_HTTP2", "0") == "1"  # h2 패키지 필요
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+OLLAMA_MAX_KEEPALIVE = int(os.getenv("OLLAMA_MAX_KEEPALIVE", "20"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
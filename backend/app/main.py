@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -5,12 +6,35 @@ from fastapi.middleware.cors import CORSMiddleware
 from app.routers.extract_txt import router as extract_txt_router
 from app.routers.summarize import router as summarize_router
 from app.routers.pipeline import router as pipeline_router
+from app.routers.metrics import router as metrics_router
+from app.routers.summaries import router as summaries_router
+from app.storage.summary_repository import summary_repo, summary_writer
+from app.services.ollama_recorder import recorder
+from app.services.ollama_transport import ollama_transport
+from app.services.chunk_batcher import chunk_batcher
 
 # 개발용 에러메세지 포함
 import logging
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI(title="Sift API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ollama 연결 풀 (종료 시 커넥션 정리)
+    ollama_transport.open()
+    # 요약 저장소: 커넥션 풀 열기 + 배치 writer 시작
+    summary_repo.open()
+    summary_writer.start()
+    # Ollama 호출 기록기 (SIFT_RECORD_DIR 설정 시)
+    recorder.start()
+    yield
+    # 진행 중인 map 묶음 호출 정리 (Ollama 연결을 닫기 전에)
+    await chunk_batcher.aclose()
+    recorder.stop()
+    await summary_writer.stop()
+    summary_repo.close()
+    await ollama_transport.aclose()
+
+app = FastAPI(title="Sift API", version="0.1.0", lifespan=lifespan)
 
 # 개발 단계 CORS 
 app.add_middleware(
@@ -30,3 +54,5 @@ def health_check():
 app.include_router(extract_txt_router) # 텍스트 추출
 app.include_router(summarize_router) # Ollama 요약 
 app.include_router(pipeline_router) # 텍스트 추출 + Ollama 요약 pipeline
+app.include_router(metrics_router) # 모니터링 지표
+app.include_router(summaries_router) # 요약 이력
@@ -0,0 +1,27 @@
+from fastapi import APIRouter
+from app.routers.pipeline import pipeline_flight
+from app.services.ollama_client import generate_flight
+from app.services.chunk_batcher import chunk_batcher
+from app.services.ollama_recorder import recorder
+from app.services.cascade import cascade_stats
+from app.services.ollama_transport import ollama_transport
+from app.services.prompt_registry import prompt_registry
+from app.storage.summary_repository import summary_writer
+
+router = APIRouter(prefix="/api", tags=["metrics"])
+
+@router.get("/metrics")
+async def metrics():
+    # 운영 모니터링용 카운터 (JSON)
+    return {
+        "ollama_transport": ollama_transport.stats(),
+        "singleflight": {
+            "pipeline_txt": pipeline_flight.stats(),
+            "ollama_generate": generate_flight.stats(),
+        },
+        "map_batching": chunk_batcher.stats(),
+        "recorder": recorder.stats(),
+        "summary_writer": summary_writer.stats(),
+        "cascade": cascade_stats.stats(),
+        "prompts": prompt_registry.stats(),
+    }
@@ -4,13 +4,20 @@
 불릿 추출·필터링, 프롬프트 강화, continue 로직을 개선한 FastAPI 라우터입니다.
 """
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from typing import Literal, List
-import time, re, asyncio
+from fastapi import APIRouter, UploadFile, File, HTTPException, Form, Request
+from typing import Literal, List, Optional
+import time, re, asyncio, hashlib, json, zlib
 
 from app.services.txt_extractor import extract_txt_bytes
-from app.services.prompt_builder import build_prompt, build_news_prompt, build_chunk_prompt
-from app.services.ollama_client import ollama_generate
+from app.services.prompt_builder import build_prompt, build_news_prompt, build_continue_prompt, build_repair_prompt
+from app.services.chunk_batcher import chunk_batcher, chunk_options_hash
+from app.services.ollama_client import ollama_generate, pick_ollama_metrics, generation_budget
+from app.services.tracer import span, start_trace, maybe_profile, append_trace_file
+from app.services.num_predict_tuner import tuner
+from app.services.singleflight import SingleFlight
+from app.storage.summary_repository import summary_repo, summary_writer
+from app.services.cascade import plan_tiers, tier_name, cascade_stats
+from app.core.config import TRACE_FILE, MAP_BATCHING, CASCADE
 
 # ── 불릿 추출용 정규식과 도우미 ────────────────────────────────────────────
 _BULLET_RE = re.compile(r"^\s*(?:[-•]|\d+[\.\)\-])\s*(.*)$")
@@ -60,48 +67,39 @@ def normalize_bullets(text: str) -> List[str]:
         bullets.append(b)
     return bullets
 
-# 성능 검증 디버깅
-def _ns_to_ms(v):
-    return None if v is None else int(v / 1_000_000)
-
-def pick_ollama_metrics(d: dict) -> dict:
-    out = {}
-    for k in ["done_reason", "prompt_eval_count", "eval_count"]:
-        if k in d:
-            out[k] = d.get(k)
-
-    for k in ["total_duration", "load_duration", "prompt_eval_duration", "eval_duration"]:
-        if k in d:
-            out[k] = _ns_to_ms(d.get(k))
-
-    # tok/s 추가
-    ev = out.get("eval_count")
-    ev_ms = out.get("eval_duration")
-    if ev is not None and ev_ms:
-        out["tok_per_sec"] = round(ev / (ev_ms / 1000), 2)
-
-    pv = out.get("prompt_eval_count")
-    pv_ms = out.get("prompt_eval_duration")
-    if pv is not None and pv_ms:
-        out["prompt_tok_per_sec"] = round(pv / (pv_ms / 1000), 2)
-
-    return out
-
-
 def render_5(bullets: List[str]) -> str:
     return "\n".join(bullets[:5])
 
-def split_text(text: str, max_len: int) -> List[str]:
-    # 개행 단위로 길이를 맞춰 자름
-    chunks, pos, length = [], 0, len(text)
-    while pos < length:
-        end = min(pos + max_len, length)
-        newline_pos = text.rfind("\n", pos, end)
-        if newline_pos <= pos: newline_pos = end
-        chunk = text[pos:newline_pos]
-        if chunk: chunks.append(chunk)
-        pos = newline_pos
-    return chunks
+def split_text_stable(text: str, max_len: int, min_len: Optional[int] = None) -> List[str]:
+    """
+    내용 기반 경계로 자름. 줄 단위로 모으다가
+    - 다음 줄을 더하면 max_len을 넘거나
+    - min_len 이상 모였고 방금 넣은 줄이 '앵커'(빈 줄 또는 줄 해시 % 3 == 0)면 자른다.
+    앞쪽 문단이 수정돼도 그 뒤 경계가 원래 자리로 다시 맞춰지므로, 청크 해시를 재사용할 수 있다.
+    """
+    min_len = max_len // 3 if min_len is None else min_len
+    chunks, cur = [], ""
+    for line in text.splitlines(keepends=True):
+        # 한 줄이 max_len보다 길면 강제로 자름
+        while len(line) > max_len:
+            if cur:
+                chunks.append(cur)
+                cur = ""
+            chunks.append(line[:max_len])
+            line = line[max_len:]
+        if cur and len(cur) + len(line) > max_len:
+            chunks.append(cur)
+            cur = ""
+        cur += line
+        if len(cur) >= min_len and zlib.crc32(line.strip().encode("utf-8")) % 3 == 0:
+            chunks.append(cur)
+            cur = ""
+    if cur:
+        chunks.append(cur)
+    return [c for c in chunks if c.strip()]
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.strip().encode("utf-8")).hexdigest()
 
 def bullet_looks_cut(line: str) -> bool:
     s = line.strip()
@@ -114,65 +112,15 @@ def bullet_complete(line: str) -> bool:
     # "~다" 또는 "~다."로 끝나면 완성으로 간주
     return bool(re.search(r"다[.!?]?$", s))
 
-def build_continue_prompt(article_tail: str, current_bullets: List[str], remain: int) -> str:
-    existing = "\n".join(current_bullets) if current_bullets else "(없음)"
-    return f"""
-당신은 뉴스 기사의 핵심 수치와 사실관계를 왜곡 없이 전달하는 한국어 요약 전문가입니다.
-
-현재까지 작성한 불릿:
-{existing}
-
-금지:
-- 위 불릿에서 이미 언급된 '숫자/연도/계약건수/승인건수/서비스명/사업명'을 다시 쓰지 마라.
-- 같은 사실을 다른 말로 반복하지 마라.
-
-남은 불릿 {remain}줄을 추가하세요.
-
-규칙:
-1. 한국어로만 작성
-2. 문장은 평서문(~다. 체)으로 끝낼 것
-3. 원문에 없는 숫자·정보를 추가하지 말 것
-4. 고유명사·날짜·금액 등 핵심 수치는 원문 그대로 유지
-5. 서두나 인사 없이 결과만 출력
-6. 각 줄은 “- ”로 시작
-7. “마지막 불릿이 문장 중간에서 끝났으면, 그 불릿을 먼저 완성하고 나머지 불릿을 작성하라.”
-
-[원문 뒤쪽 발췌]
-{article_tail}
-""".strip()
-
-def build_repair_prompt(article_tail: str, current_bullets: List[str]) -> str:
-    existing = "\n".join(current_bullets) if current_bullets else "(없음)"
-    return f"""
-당신은 뉴스 기사의 사실/수치를 왜곡 없이 전달하는 한국어 요약 전문가입니다.
-
-아래 '현재 불릿'은 마지막 문장이 끊겼거나 불완전할 수 있습니다.
-[원문 뒤쪽 발췌]를 참고해 사실/수치를 유지하면서,
-불릿 5줄을 완전한 문장으로 다시 작성하세요.
-
-규칙:
-1. 한국어만
-2. 정확히 5줄
-3. 각 줄은 "- "로 시작
-4. 원문에 없는 정보/숫자 추가 금지
-5. 중복 금지
-6. 각 문장은 "~다."로 끝내기
-7. 마지막 불릿이 끊겼다면 먼저 자연스럽게 완성할 것
-8. 서두/인사 없이 결과만 출력
-
-[현재 불릿]
-{existing}
-
-[원문 뒤쪽 발췌]
-{article_tail}
-""".strip()
-
 # ── FastAPI 라우터 ───────────────────────────────────────────────────────
 router = APIRouter(prefix="/api/pipeline", tags=["pipeline"])
 DEFAULT_MODEL = "gemma3:4b"
+DISCONNECT_POLL_SEC = 0.5
+pipeline_flight = SingleFlight("pipeline_txt")
 
 @router.post("/txt")
 async def pipeline_txt(
+    request: Request,
     file: UploadFile = File(...),
     model: str = Form(DEFAULT_MODEL),
     mode: Literal["news", "default", "report"] = Form("news"),
@@ -182,42 +130,291 @@ async def pipeline_txt(
     max_chars: int = Form(1200),
     truncate_extract: bool = Form(True),
     include_text: bool = Form(False),
+    trace: bool = Form(False),      # 스팬 트리를 응답에 포함
+    profile: bool = Form(False),    # Python 쪽 CPU 샘플링 프로파일을 응답에 포함
+    use_cache: bool = Form(True),   # 저장된 동일 요약이 있으면 재사용
+    batch_map: bool = Form(MAP_BATCHING),  # map 청크를 다른 요청의 청크와 묶어서 요약
+    reuse_chunks: bool = Form(True),  # 이전 버전과 같은 청크는 저장된 청크 요약 재사용
+    cascade: bool = Form(True),     # SIFT_CASCADE 설정이 있으면 작은 모델부터 시도
 ):
-    # 파일 검증 및 텍스트 추출
+    # 파일 검증
     if not (file.filename or "").lower().endswith(".txt"):
         raise HTTPException(status_code=400, detail="Only .txt files are allowed.")
-    raw = await file.read()
-    extracted = extract_txt_bytes(raw, truncate=truncate_extract)
+
+    # TRACE_FILE이 설정돼 있으면 응답에 넣지 않더라도 트레이스는 수집해서 파일에 남긴다
+    with start_trace("pipeline.txt", enabled=trace or bool(TRACE_FILE), model=model, mode=mode) as root, \
+         maybe_profile(profile) as prof:
+        t_read_start = time.perf_counter()
+        with span("upload.read") as sp:
+            raw = await file.read()
+            if sp is not None:
+                sp.set(bytes=len(raw))
+        ms_upload_read = int((time.perf_counter() - t_read_start) * 1000)
+
+        doc_hash = hashlib.sha256(raw).hexdigest()
+        options = {
+            "temperature": temperature, "top_p": top_p, "num_predict": num_predict,
+            "max_chars": max_chars, "truncate_extract": truncate_extract,
+            # 캐스케이드 여부에 따라 작은 모델 결과가 나올 수 있으므로 저장 키에 포함
+            "cascade": cascade,
+        }
+        options_hash = hashlib.sha256(json.dumps(options, sort_keys=True).encode("utf-8")).hexdigest()
+
+        # 같은 문서 + 모델 + 모드 + 옵션으로 만든 요약이 저장돼 있으면 LLM 없이 바로 반환
+        cached = None
+        if use_cache and not include_text:
+            t_lookup_start = time.perf_counter()
+            with span("store.lookup") as sp:
+                cached = await asyncio.to_thread(summary_repo.find_latest, doc_hash, model, mode, options_hash)
+                if sp is not None:
+                    sp.set(hit=cached is not None)
+
+        if cached is not None:
+            result, shared = _stored_result(cached, (time.perf_counter() - t_lookup_start) * 1000), False
+        else:
+            async def run():
+                computed = await _pipeline_txt(
+                    raw, model, mode, temperature, top_p, num_predict, max_chars, truncate_extract, include_text,
+                    batch_map, reuse_chunks, cascade,
+                )
+                # 저장은 공유 계산 안에서 한 번만 (leader 연결이 끊겨도 합류한 요청 몫으로 저장됨)
+                # 불릿 부족/빈 요약/length로 끊긴 결과는 캐시로 계속 재사용되지 않도록 저장하지 않음
+                if summary_passes(mode, computed):
+                    summary_writer.submit(
+                        _summary_row(computed, doc_hash, file.filename, model, mode, options, options_hash)
+                    )
+                return computed
+
+            if trace or profile:
+                # 디버그 요청은 자기 트레이스/프로파일이 필요하므로 합류하지 않고 단독 실행
+                result, shared = await run(), False
+            else:
+                # 같은 내용 + 같은 옵션의 요청이 진행 중이면 그 결과를 같이 받는다
+                key = (doc_hash, model, mode, options_hash, include_text, batch_map, reuse_chunks, cascade)
+                with span("singleflight") as sp:
+                    result, shared = await _cancel_on_disconnect(request, pipeline_flight.do(key, run))
+                    if sp is not None:
+                        sp.set(coalesced=shared)
+
+    # 결과 dict는 합류한 요청끼리 공유되므로 요청별 값은 복사본에만 넣는다
+    result = {
+        **result,
+        "filename": file.filename,
+        "meta": {
+            **result["meta"], "ms_upload_read": ms_upload_read, "coalesced": shared,
+            "cache": result["meta"].get("cache") or {"hit": False},
+        },
+    }
+    if root is not None:
+        tree = root.to_dict()
+        await asyncio.to_thread(append_trace_file, tree)
+        if trace:
+            result["trace"] = tree
+    if prof is not None:
+        result["profile"] = prof.result()
+    return result
+
+
+def _summary_row(result: dict, doc_hash: str, filename: str, model: str, mode: str,
+                 options: dict, options_hash: str) -> dict:
+    summary = result["summarize"]["summary"]
+    extract = {k: v for k, v in result["extract"].items() if k not in ("text", "prompt_debug")}
+    return {
+        "doc_hash": doc_hash,
+        "filename": filename,
+        "model": model,
+        "served_by": result["summarize"]["model"],
+        "mode": mode,
+        "options": options,
+        "options_hash": options_hash,
+        "summary": summary,
+        "bullets": get_bullets(summary),
+        "done_reason": result["summarize"].get("done_reason"),
+        "extract": extract,
+        "elapsed_ms": result["meta"].get("elapsed_ms"),
+    }
+
+
+def _stored_result(row: dict, lookup_ms: float) -> dict:
+    return {
+        "ok": True,
+        "extract": row["extract"],
+        "summarize": {
+            "model": row.get("served_by") or row["model"], "mode": row["mode"], "summary": row["summary"], "done_reason": row["done_reason"],
+        },
+        "meta": {
+            "elapsed_ms": int(lookup_ms),
+            "ms_build_prompt": 0,
+            "ms_ollama": 0,
+            "cache": {"hit": True, "id": row["id"], "created_at": row["created_at"]},
+        },
+    }
+
+
+async def _cancel_on_disconnect(request: Request, aw):
+    """
+    클라이언트 연결이 끊기면 대기를 취소한다.
+    (single-flight에서는 마지막 대기자가 빠질 때만 실제 계산이 취소됨)
+    """
+    task = asyncio.ensure_future(aw)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SEC)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            raise HTTPException(status_code=499, detail="Client disconnected.")
+
+
+@router.get("/num-predict")
+async def num_predict_tuning():
+    # (model, mode, stage)별 학습된 num_predict 예산과 관측 완료율
+    return tuner.snapshot()
+
+
+async def _pipeline_txt(
+    raw: bytes,
+    model: str,
+    mode: str,
+    temperature: float,
+    top_p: float,
+    num_predict: int,
+    max_chars: int,
+    truncate_extract: bool,
+    include_text: bool,
+    batch_map: bool = False,
+    reuse_chunks: bool = True,
+    cascade: bool = True,
+) -> dict:
+    # 텍스트 추출
+    t_extract_start = time.perf_counter()
+    with span("extract"):
+        extracted = extract_txt_bytes(raw, truncate=truncate_extract)
+    t_extract_end = time.perf_counter()
     full_text = extracted["text"]
     clipped = full_text[:max_chars]
 
+    # elapsed_ms는 기존과 동일하게 추출 이후부터, 업로드/추출 시간은 별도 필드로
+    read_extract_meta = {
+        "ms_extract": int((t_extract_end - t_extract_start) * 1000),
+    }
+
+    # 캐스케이드: 작은 모델로 먼저 요약하고, 검증에 실패하면 요청된 모델로 다시 (repair는 마지막 tier에서만)
+    tiers = plan_tiers(mode, model, len(clipped)) if cascade else [model]
+    attempts = []
+    t_start = time.perf_counter()
+    for idx, tier_model in enumerate(tiers):
+        last = idx == len(tiers) - 1
+        t_tier = time.perf_counter()
+        with span("tier", model=tier_model, index=idx) as sp:
+            result = await _summarize_clipped(
+                extracted, full_text, clipped, read_extract_meta, tier_model, mode, temperature, top_p,
+                num_predict, include_text, batch_map, reuse_chunks, allow_repair=last,
+            )
+            ok = summary_passes(mode, result)
+            if sp is not None:
+                sp.set(passed=ok)
+        tier_ms = (time.perf_counter() - t_tier) * 1000
+        if CASCADE.get(mode):
+            cascade_stats.observe(mode, tier_name(mode, tier_model), tier_model, ok, tier_ms)
+        attempts.append({"model": tier_model, "passed": ok, "ms": int(tier_ms)})
+        if ok:
+            break
+
+    if len(attempts) > 1 or CASCADE.get(mode):
+        result["meta"]["elapsed_ms"] = int((time.perf_counter() - t_start) * 1000)
+        result["meta"]["cascade"] = {"tiers": tiers, "served_by": attempts[-1]["model"], "attempts": attempts}
+    return result
+
+
+def summary_passes(mode: str, result: dict) -> bool:
+    """캐스케이드 검증: 기존 repair 판단 기준(불릿 수/문장 완결/끊김/length)을 그대로 사용."""
+    s = result["summarize"]
+    if s.get("done_reason") == "length" or not s.get("summary"):
+        return False
+    if mode != "news":
+        return True
+    bullets = normalize_bullets(s["summary"])
+    return (
+        len(bullets) >= 5 and
+        bullet_complete(bullets[-1]) and
+        not bullet_looks_cut(bullets[-1])
+    )
+
+
+def _budget(model: str, mode: str, num_predict: int) -> dict:
+    # 프롬프트 렌더링 시 원문을 잘라 맞출 컨텍스트 예산 (ollama_generate와 같은 num_ctx/num_predict)
+    num_ctx, num_predict = generation_budget(mode, num_predict)
+    return {"model": model, "num_ctx": num_ctx, "num_predict": num_predict}
+
+
+async def _summarize_clipped(
+    extracted: dict,
+    full_text: str,
+    clipped: str,
+    read_extract_meta: dict,
+    model: str,
+    mode: str,
+    temperature: float,
+    top_p: float,
+    num_predict: int,
+    include_text: bool,
+    batch_map: bool,
+    reuse_chunks: bool,
+    allow_repair: bool = True,
+) -> dict:
     # 뉴스 모드: 긴 문서는 map-reduce+병렬 처리, 짧은 문서는 1회+보강 처리
     final_repair_metrics = None
     use_map_reduce = mode == "news" and len(clipped) > 800
     t0 = time.perf_counter()
 
     if mode == "news" and use_map_reduce:
-        m1 = {}
-        m2 = None
-        m3 = None
-        # 1. 텍스트를 여러 조각으로 분할
-        chunks = split_text(clipped, 600)
+        prompt_build_ms = 0.0
+        # 1. 텍스트를 여러 조각으로 분할 (수정본도 경계가 유지되도록 내용 기반 분할)
+        with span("split") as sp:
+            chunks = split_text_stable(clipped, 600)
+            hashes = [chunk_hash(c) for c in chunks]
+            if sp is not None:
+                sp.set(chunks=len(chunks))
+
+        # 이전 버전에서 이미 요약한 청크는 재사용 (바뀐/추가된 청크만 map)
+        chunk_opts = chunk_options_hash(top_p)
+        reused = {}
+        if reuse_chunks:
+            with span("chunk.lookup") as sp:
+                reused = await asyncio.to_thread(summary_repo.find_chunk_summaries, model, chunk_opts, hashes)
+                if sp is not None:
+                    sp.set(reused=len(reused))
+        todo = [i for i, h in enumerate(hashes) if h not in reused]
 
         # 2. 각 조각을 병렬로 요약
-        async def summarise_chunk(c):
-            return await ollama_generate(
-                model=model,
-                prompt=build_chunk_prompt(c),
-                mode="default",
-                temperature=0.1,
-                top_p=top_p,
-                num_predict = 120,
-                timeout_sec=120,
-            )
+        async def summarise_chunk(i, c):
+            with span("map.chunk", index=i, chars=len(c)):
+                return await chunk_batcher.summarize(model, c, top_p=top_p, batch=batch_map)
         t_map_start = time.perf_counter()
-        chunk_responses = await asyncio.gather(*(summarise_chunk(c) for c in chunks))
-        map_metrics = [pick_ollama_metrics(r) for r in chunk_responses if isinstance(r, dict)]
+        with span("map", chunks=len(todo)):
+            fresh = await asyncio.gather(*(summarise_chunk(i, chunks[i]) for i in todo))
+        map_metrics = [
+            {**pick_ollama_metrics(r), **({"packed_sections": r["packed_sections"]} if "packed_sections" in r else {})}
+            for r in fresh if isinstance(r, dict)
+        ]
         t_map_end = time.perf_counter()
+        # 청크 프롬프트는 chunk_batcher 안에서 만들어지므로 각 결과가 보고한 시간을 합산
+        prompt_build_ms += sum(r.get("prompt_build_ms") or 0 for r in fresh if isinstance(r, dict))
+
+        # 새로 요약한 청크는 다음 버전을 위해 저장 (length로 끊긴 결과는 저장하지 않음)
+        chunk_responses = [{"response": reused[h]} if h in reused else None for h in hashes]
+        for i, r in zip(todo, fresh):
+            chunk_responses[i] = r
+            if r.get("response") and r.get("done_reason") != "length":
+                summary_writer.submit_chunk({
+                    "chunk_hash": hashes[i], "model": model, "options_hash": chunk_opts,
+                    "summary": r["response"].strip(),
+                })
 
         intermediate = [
             res.get("response", "").strip()
@@ -227,49 +424,62 @@ async def pipeline_txt(
 
         # 3. 중간 요약을 다시 뉴스 형식으로 요약
         t_reduce_start = time.perf_counter()
-        final_prompt = build_news_prompt(combined)
-        final_data = await ollama_generate(
-            model=model,
-            prompt=final_prompt,
-            mode="news",
-            temperature=temperature,
-            top_p=top_p,
-            num_predict=num_predict,
-            timeout_sec=180,
-        )
-        reduce_metrics = pick_ollama_metrics(final_data)
-        t_reduce_end = time.perf_counter()
-
-        out = (final_data.get("response") or "").strip()
-        bullets = normalize_bullets(out)
-        bullets_final = bullets[:]
-        summary = render_5(bullets_final) if bullets_final else out
-        
-
-        # 최종 검증 후, 필요하면 마지막으로 repair 1회 더
-        final_need_repair = (
-            len(bullets_final) < 5 or
-            (bullets_final and (not bullet_complete(bullets_final[-1]) or bullet_looks_cut(bullets_final[-1])))
-        )
-
-        if final_need_repair:
-            tail = clipped[-600:]
-            final_repair_prompt = build_repair_prompt(tail, bullets_final)
-
-            dataF = await ollama_generate(
+        with span("reduce", input_chars=len(combined)):
+            tp = time.perf_counter()
+            final_prompt = build_news_prompt(combined, **_budget(model, "news", num_predict))
+            prompt_build_ms += (time.perf_counter() - tp) * 1000
+            final_data = await ollama_generate(
                 model=model,
-                prompt=final_repair_prompt,
+                prompt=final_prompt,
                 mode="news",
                 temperature=temperature,
                 top_p=top_p,
-                num_predict=220,     # 너무 크게 말고(속도), 5줄 나오게 적당히
-                timeout_sec=60,
+                num_predict=num_predict,
+                stage="reduce",
+                timeout_sec=180,
             )
+        reduce_metrics = pick_ollama_metrics(final_data)
+        t_reduce_end = time.perf_counter()
+
+        final_done_reason = final_data.get("done_reason")
+        with span("postprocess"):
+            out = (final_data.get("response") or "").strip()
+            bullets = normalize_bullets(out)
+            bullets_final = bullets[:]
+            summary = render_5(bullets_final) if bullets_final else out
+
+            # 최종 검증 후, 필요하면 마지막으로 repair 1회 더
+            final_need_repair = (
+                len(bullets_final) < 5 or
+                (bullets_final and (not bullet_complete(bullets_final[-1]) or bullet_looks_cut(bullets_final[-1])))
+            )
+
+        t_repair_start = time.perf_counter()
+        if final_need_repair and allow_repair:
+            with span("repair"):
+                tail = clipped[-600:]
+                tp = time.perf_counter()
+                final_repair_prompt = build_repair_prompt(tail, bullets_final, **_budget(model, "news", 220))
+                prompt_build_ms += (time.perf_counter() - tp) * 1000
+
+                dataF = await ollama_generate(
+                    model=model,
+                    prompt=final_repair_prompt,
+                    mode="news",
+                    temperature=temperature,
+                    top_p=top_p,
+                    num_predict=220,     # 너무 크게 말고(속도), 5줄 나오게 적당히
+                    stage="final_repair",
+                    timeout_sec=60,
+                )
             final_repair_metrics = pick_ollama_metrics(dataF)
-            outF = (dataF.get("response") or "").strip()
-            bulletsF = normalize_bullets(outF)
-            if bulletsF:
-                bullets_final = bulletsF[:5]
+            final_done_reason = dataF.get("done_reason")
+            with span("postprocess"):
+                outF = (dataF.get("response") or "").strip()
+                bulletsF = normalize_bullets(outF)
+                if bulletsF:
+                    bullets_final = bulletsF[:5]
+        t_repair_end = time.perf_counter()
 
         # (repair 반영된 bullets_final 기준으로 summary 다시 만들기)
         summary = render_5(bullets_final) if bullets_final else out
@@ -281,13 +491,17 @@ async def pipeline_txt(
             "input_chars": len(full_text),
             "sent_chars": len(clipped),
             "map_chunks": len(chunks),
+            "map_reused": len(chunks) - len(todo),
+            "skipped_for_cascade": bool(final_need_repair and not allow_repair),
+            "reduce_truncated_chars": final_prompt.truncated_chars,
             "map_time_ms": int((t_map_end - t_map_start) * 1000),
             "reduce_time_ms": int((t_reduce_end - t_reduce_start) * 1000),
+            "repair_time_ms": int((t_repair_end - t_repair_start) * 1000),
             "ollama": {
                         "map": map_metrics[:5],          # chunk가 많으면 너무 길어지니 앞 5개만
                         "map_count": len(map_metrics),
                         "reduce": reduce_metrics,
-                        "final_repair": final_repair_metrics if final_need_repair else None,
+                        "final_repair": final_repair_metrics,
                     },
         }
         if include_text:
@@ -296,13 +510,13 @@ async def pipeline_txt(
         t1 = time.perf_counter()
         return {
             "ok": True,
-            "filename": file.filename,
             "extract": extract_resp,
-            "summarize": {"model": model, "mode": mode, "summary": summary},
+            "summarize": {"model": model, "mode": mode, "summary": summary, "done_reason": final_done_reason},
             "meta": {
                 "elapsed_ms": int((t1 - t0) * 1000),
-                "ms_build_prompt": 0,
-                "ms_ollama": extract_resp["map_time_ms"] + extract_resp["reduce_time_ms"],
+                "ms_build_prompt": int(prompt_build_ms),
+                "ms_ollama": extract_resp["map_time_ms"] + extract_resp["reduce_time_ms"] + extract_resp["repair_time_ms"],
+                **read_extract_meta,
             },
         }
 
@@ -313,39 +527,48 @@ async def pipeline_txt(
 
         # 1차 프롬프트: 강화된 뉴스 프롬프트
         t_prompt_start = time.perf_counter()
-        prompt = build_news_prompt(clipped)
+        prompt = build_news_prompt(clipped, **_budget(model, "news_first", num_predict))
         t_prompt_end = time.perf_counter()
 
         # 1차 호출
         t_call1_start = time.perf_counter()
-        data1 = await ollama_generate(
-            model=model,
-            prompt=prompt,
-            mode="news_first",
-            temperature=temperature,
-            top_p=top_p,
-            num_predict=num_predict,
-            timeout_sec=180,
-        )
+        with span("first"):
+            data1 = await ollama_generate(
+                model=model,
+                prompt=prompt,
+                mode="news_first",
+                temperature=temperature,
+                top_p=top_p,
+                num_predict=num_predict,
+                stage="first",
+                timeout_sec=180,
+            )
         t_call1_end = time.perf_counter()
         m1 = pick_ollama_metrics(data1)
 
-        out1 = (data1.get("response") or "").strip()
-        bullets1 = normalize_bullets(out1)
-
-        first_done_reason = data1.get("done_reason")
-        first_bullets = len(bullets1) 
-        # length면 불릿 수와 무관하게 "끊김" 확률이 매우 높으므로 repair 우선
-        last_bullet = bullets1[-1] if bullets1 else ""
-        need_repair = (
-            first_done_reason == "length" or
-            (first_bullets > 0 and not bullet_complete(last_bullet)) or
-            (first_bullets > 0 and bullet_looks_cut(last_bullet))
-        )
+        with span("postprocess"):
+            out1 = (data1.get("response") or "").strip()
+            bullets1 = normalize_bullets(out1)
+
+            first_done_reason = data1.get("done_reason")
+            first_bullets = len(bullets1) 
+            # length면 불릿 수와 무관하게 "끊김" 확률이 매우 높으므로 repair 우선
+            last_bullet = bullets1[-1] if bullets1 else ""
+            need_repair = (
+                first_done_reason == "length" or
+                (first_bullets > 0 and not bullet_complete(last_bullet)) or
+                (first_bullets > 0 and bullet_looks_cut(last_bullet))
+            )
 
         # add는 "정상적으로 끝났는데 불릿 수만 부족"할 때만
         need_add = (first_bullets < 5) and (not need_repair)
 
+        # 캐스케이드 앞 tier(allow_repair=False)는 보강 호출 없이 다음 tier로 넘기므로,
+        # 응답의 need_*/continued는 실제로 호출한 경우만 표시하고 건너뛴 사실은 따로 남긴다
+        skipped_for_cascade = (need_add or need_repair) and not allow_repair
+        need_repair = need_repair and allow_repair
+        need_add = need_add and allow_repair
+
         bullets_final = bullets1[:]
 
         prompt_build_ms = (t_prompt_end - t_prompt_start) * 1000
@@ -356,75 +579,121 @@ async def pipeline_txt(
         # 2차 호출: add(부족분 채우기) 또는 repair(5줄인데 끊김/length면 재작성)
         if need_repair:
             tail = clipped[-600:]
-            repair_prompt = build_repair_prompt(tail, bullets_final)
+            t_prompt_start = time.perf_counter()
+            repair_prompt = build_repair_prompt(tail, bullets_final, **_budget(model, "news", num_predict))
+            prompt_build_ms += (time.perf_counter() - t_prompt_start) * 1000
 
             t_call2_start = time.perf_counter()
-            data2 = await ollama_generate(
-                model=model,
-                prompt=repair_prompt,
-                mode="news",
-                temperature=temperature,
-                top_p=top_p,
-                num_predict=num_predict,
-                timeout_sec=60,
-            )
+            with span("repair"):
+                data2 = await ollama_generate(
+                    model=model,
+                    prompt=repair_prompt,
+                    mode="news",
+                    temperature=temperature,
+                    top_p=top_p,
+                    num_predict=num_predict,
+                    stage="repair",
+                    timeout_sec=60,
+                )
             t_call2_end = time.perf_counter()
             call2_ms = (t_call2_end - t_call2_start) * 1000
 
-            out2 = (data2.get("response") or "").strip()
-            bullets2 = normalize_bullets(out2)
-            m2 = pick_ollama_metrics(data2)
-
-            # 1) repair 결과 적용 (있으면 그걸 우선)
-            if bullets2:
-                bullets_final = bullets2[:5]
-            else:
-                # fallback 파싱
-                lines = [ln.strip() for ln in out2.splitlines() if ln.strip()]
-                lines = [ln.replace("<END>", "").strip() for ln in lines]
-
-                tmp = []
-                for ln in lines:
-                    if ln.startswith("-"):
-                        tmp.append("- " + ln[1:].lstrip())
-                    elif ln.startswith("•"):
-                        tmp.append("- " + ln[1:].lstrip())
-                    else:
-                        m = re.match(r"^\d+[\.\)\-]\s*(.*)$", ln)
-                        if m:
-                            tmp.append("- " + (m.group(1) or "").strip())
-                    if len(tmp) >= 5:
-                        break
-
-                if tmp:
-                    bullets_final = tmp[:5]
+            with span("postprocess"):
+                out2 = (data2.get("response") or "").strip()
+                bullets2 = normalize_bullets(out2)
+                m2 = pick_ollama_metrics(data2)
+
+                # 1) repair 결과 적용 (있으면 그걸 우선)
+                if bullets2:
+                    bullets_final = bullets2[:5]
+                else:
+                    # fallback 파싱
+                    lines = [ln.strip() for ln in out2.splitlines() if ln.strip()]
+                    lines = [ln.replace("<END>", "").strip() for ln in lines]
+
+                    tmp = []
+                    for ln in lines:
+                        if ln.startswith("-"):
+                            tmp.append("- " + ln[1:].lstrip())
+                        elif ln.startswith("•"):
+                            tmp.append("- " + ln[1:].lstrip())
+                        else:
+                            m = re.match(r"^\d+[\.\)\-]\s*(.*)$", ln)
+                            if m:
+                                tmp.append("- " + (m.group(1) or "").strip())
+                        if len(tmp) >= 5:
+                            break
+
+                    if tmp:
+                        bullets_final = tmp[:5]
 
             # 2) bullets2가 있든 없든, 5줄 미만이면 add 실행
             if len(bullets_final) < 5:
                 remain = 5 - len(bullets_final)
                 tail = clipped[-500:]
-                cont_prompt = build_continue_prompt(tail, bullets_final, remain)
+                t_prompt_start = time.perf_counter()
                 cont_tokens = min(320, 120 + (remain * 60))
+                cont_prompt = build_continue_prompt(tail, bullets_final, remain, **_budget(model, "news", cont_tokens))
+                prompt_build_ms += (time.perf_counter() - t_prompt_start) * 1000
 
                 t_call3_start = time.perf_counter()
-                data3 = await ollama_generate(
+                with span("continue", remain=remain):
+                    data3 = await ollama_generate(
+                        model=model,
+                        prompt=cont_prompt,
+                        mode="news",
+                        temperature=temperature,
+                        top_p=top_p,
+                        num_predict=cont_tokens,
+                        stage=f"continue:{remain}",
+                        timeout_sec=60,
+                    )
+                t_call3_end = time.perf_counter()
+                call2_ms += (t_call3_end - t_call3_start) * 1000
+
+                with span("postprocess"):
+                    out3 = (data3.get("response") or "").strip()
+                    bullets3 = normalize_bullets(out3)
+                    m3 = pick_ollama_metrics(data3)
+
+                    seen = set(_dedup_key(x) for x in bullets_final)
+                    for b in bullets3:
+                        k = _dedup_key(b)
+                        if k not in seen:
+                            bullets_final.append(b)
+                            seen.add(k)
+                        if len(bullets_final) >= 5:
+                            break
+
+        elif need_add:
+            remain = 5 - first_bullets
+            tail = clipped[-500:]
+            t_prompt_start = time.perf_counter()
+            cont_tokens = min(240, 80 + remain * 40)
+            cont_prompt = build_continue_prompt(tail, bullets_final, remain, **_budget(model, "news", cont_tokens))
+            prompt_build_ms += (time.perf_counter() - t_prompt_start) * 1000
+            t_call2_start = time.perf_counter()
+            with span("continue", remain=remain):
+                data2 = await ollama_generate(
                     model=model,
                     prompt=cont_prompt,
                     mode="news",
                     temperature=temperature,
                     top_p=top_p,
                     num_predict=cont_tokens,
+                    stage=f"continue:{remain}",
                     timeout_sec=60,
                 )
-                t_call3_end = time.perf_counter()
-                call2_ms += (t_call3_end - t_call3_start) * 1000
+            t_call2_end = time.perf_counter()
+            call2_ms = (t_call2_end - t_call2_start) * 1000
 
-                out3 = (data3.get("response") or "").strip()
-                bullets3 = normalize_bullets(out3)
-                m3 = pick_ollama_metrics(data3)
+            with span("postprocess"):
+                out2 = (data2.get("response") or "").strip()
+                bullets2 = normalize_bullets(out2)
+                m2 = pick_ollama_metrics(data2)
 
                 seen = set(_dedup_key(x) for x in bullets_final)
-                for b in bullets3:
+                for b in bullets2:
                     k = _dedup_key(b)
                     if k not in seen:
                         bullets_final.append(b)
@@ -432,43 +701,7 @@ async def pipeline_txt(
                     if len(bullets_final) >= 5:
                         break
 
-
-
-            
-        elif need_add:
-            remain = 5 - first_bullets
-            tail = clipped[-500:]
-            cont_prompt = build_continue_prompt(tail, bullets_final, remain)
-            cont_tokens = min(240, 80 + remain * 40)
-            t_call2_start = time.perf_counter()
-            data2 = await ollama_generate(
-                model=model,
-                prompt=cont_prompt,
-                mode="news",
-                temperature=temperature,
-                top_p=top_p,
-                num_predict=cont_tokens,
-                timeout_sec=60,
-            )
-            t_call2_end = time.perf_counter()
-            call2_ms = (t_call2_end - t_call2_start) * 1000
-
-            out2 = (data2.get("response") or "").strip()
-            bullets2 = normalize_bullets(out2)
-            m2 = pick_ollama_metrics(data2)
-
-            seen = set(_dedup_key(x) for x in bullets_final)
-            for b in bullets2:
-                k = _dedup_key(b)
-                if k not in seen:
-                    bullets_final.append(b)
-                    seen.add(k)
-                if len(bullets_final) >= 5:
-                    break
-
-
-
-        summary = render_5(bullets_final) if bullets_final else out
+        summary = render_5(bullets_final) if bullets_final else out1
         extract_resp = {
             "encoding": extracted["encoding"],
             "bytes": extracted["bytes"],
@@ -480,6 +713,8 @@ async def pipeline_txt(
             "continued": (need_add or need_repair),
             "need_add": need_add,
             "need_repair": need_repair,
+            "skipped_for_cascade": skipped_for_cascade,
+            "prompt_truncated_chars": prompt.truncated_chars,
             # 디버그(핵심): raw 응답 일부
             "raw_tail_1": (data1.get("response") or "")[-120:],
             "raw_head_2": out2[:300] if out2 else "",
@@ -495,7 +730,6 @@ async def pipeline_txt(
         t1 = time.perf_counter()
         return {
             "ok": True,
-            "filename": file.filename,
             "extract": extract_resp,
             "summarize": {
                 "model": model, "mode": mode, "summary": summary, "done_reason": first_done_reason,
@@ -504,24 +738,27 @@ async def pipeline_txt(
                 "elapsed_ms": int((t1 - t0) * 1000),
                 "ms_build_prompt": int(prompt_build_ms),
                 "ms_ollama": int(call1_ms + call2_ms),
+                **read_extract_meta,
             },
         }
     
     # default / report 모드
     t_prompt_start = time.perf_counter()
-    prompt = build_prompt(clipped, mode)
+    prompt = build_prompt(clipped, mode, **_budget(model, mode, num_predict))
     t_prompt_end = time.perf_counter()
 
     t_call_start = time.perf_counter()
-    data = await ollama_generate(
-        model=model,
-        prompt=prompt,
-        mode=mode,
-        temperature=temperature,
-        top_p=top_p,
-        num_predict=num_predict,
-        timeout_sec=180,
-    )
+    with span("generate"):
+        data = await ollama_generate(
+            model=model,
+            prompt=prompt,
+            mode=mode,
+            temperature=temperature,
+            top_p=top_p,
+            num_predict=num_predict,
+            stage="generate",
+            timeout_sec=180,
+        )
     t_call_end = time.perf_counter()
 
     summary = (data.get("response") or "").strip()
@@ -532,6 +769,7 @@ async def pipeline_txt(
         "input_chars": len(full_text),
         "sent_chars": len(clipped),
         "revealed_done_reason": data.get("done_reason"),
+        "prompt_truncated_chars": prompt.truncated_chars,
     }
     if include_text:
         extract_resp["text"] = clipped
@@ -539,7 +777,6 @@ async def pipeline_txt(
     t1 = time.perf_counter()
     return {
         "ok": True,
-        "filename": file.filename,
         "extract": extract_resp,
         "summarize": {
             "model": model, "mode": mode, "summary": summary, "done_reason": data.get("done_reason"),
@@ -548,5 +785,6 @@ async def pipeline_txt(
             "elapsed_ms": int((t1 - t0) * 1000),
             "ms_build_prompt": int((t_prompt_end - t_prompt_start) * 1000),
             "ms_ollama": int((t_call_end - t_call_start) * 1000),
+            **read_extract_meta,
         },
     }
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+import asyncio
+
+from app.storage.summary_repository import summary_repo
+
+router = APIRouter(prefix="/api/summaries", tags=["summaries"])
+
+# 요약 이력 목록/검색 (keyset 페이지네이션: 응답의 next_cursor를 다음 요청의 cursor로)
+@router.get("")
+async def list_summaries(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    model: Optional[str] = None,
+    mode: Optional[str] = None,
+    doc_hash: Optional[str] = None,
+    q: Optional[str] = None,
+):
+    try:
+        return await asyncio.to_thread(
+            summary_repo.list, limit=limit, cursor=cursor, model=model, mode=mode, doc_hash=doc_hash, q=q,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+# 요약 단건 조회
+@router.get("/{summary_id}")
+async def get_summary(summary_id: int):
+    row = await asyncio.to_thread(summary_repo.get, summary_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Summary not found.")
+    return row
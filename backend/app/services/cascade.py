@@ -0,0 +1,58 @@
+# cascade.py
+"""
+모드별 모델 캐스케이드 설정과 tier별 통계입니다.
+작은(빠른) 모델로 먼저 요약하고, 검증(불릿 수/문장 완결/done_reason)에 실패한 요청만
+요청된 큰 모델로 올려 처리합니다. 너무 긴 기사는 작은 모델이 실패할 확률이 높으므로 바로 큰 모델로 보냅니다.
+
+설정 예 (SIFT_CASCADE, JSON):
+    {"news": {"small": "gemma3:1b", "max_small_chars": 3000}}
+"""
+
+from typing import Dict, List
+
+from app.core.config import CASCADE
+
+
+def tier_name(mode: str, model: str) -> str:
+    cfg = CASCADE.get(mode) or {}
+    return "small" if cfg.get("small") == model else "large"
+
+
+def plan_tiers(mode: str, model: str, input_chars: int) -> List[str]:
+    """이번 요청에서 시도할 모델 순서. 캐스케이드 미설정이면 [model]."""
+    cfg = CASCADE.get(mode)
+    if not cfg or not cfg.get("small") or cfg["small"] == model:
+        return [model]
+    if input_chars > int(cfg.get("max_small_chars", 0) or 0) > 0:
+        # 긴 기사는 바로 큰 모델
+        return [model]
+    return [cfg["small"], model]
+
+
+class CascadeStats:
+    def __init__(self):
+        self._tiers: Dict[str, dict] = {}
+
+    def observe(self, mode: str, tier: str, model: str, ok: bool, elapsed_ms: float) -> None:
+        s = self._tiers.setdefault(f"{mode}|{tier}|{model}", {
+            "mode": mode, "tier": tier, "model": model,
+            "attempts": 0, "passed": 0, "failed": 0, "latency_ms": 0.0,
+        })
+        s["attempts"] += 1
+        s["passed" if ok else "failed"] += 1
+        s["latency_ms"] += elapsed_ms
+
+    def stats(self) -> dict:
+        out = {"config": CASCADE, "tiers": []}
+        for s in self._tiers.values():
+            n = max(1, s["attempts"])
+            out["tiers"].append({
+                **s,
+                "latency_ms": round(s["latency_ms"], 1),
+                "success_rate": round(s["passed"] / n, 3),
+                "latency_ms_avg": round(s["latency_ms"] / n, 1),
+            })
+        return out
+
+
+cascade_stats = CascadeStats()
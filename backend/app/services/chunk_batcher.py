@@ -0,0 +1,295 @@
+# chunk_batcher.py
+"""
+여러 문서의 짧은 map 청크를 모아 하나의 프롬프트로 요약하는 마이크로 배처입니다.
+같은 모델로 들어온 청크를 짧은 시간 창(window) 동안 모은 뒤 섹션 구분 프롬프트 한 번으로 보내고,
+응답을 섹션 번호(<<N>>)로 나눠 각 요청자에게 돌려줍니다.
+섹션을 찾지 못한 청크는 개별 호출로 다시 요약합니다.
+
+지시문 prompt-eval과 요청당 오버헤드를 여러 청크가 나눠 내므로, 동시 요청이 많을 때 유리합니다.
+배칭/비배칭 모드별 토큰·지연 통계를 같이 모아 /api/metrics에서 비교할 수 있게 합니다.
+"""
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.config import MAP_BATCH_WINDOW_MS, MAP_BATCH_MAX_SECTIONS, MAP_BATCH_MAX_CHARS
+from app.services.ollama_client import ollama_generate
+from app.services.prompt_builder import build_chunk_prompt, build_packed_chunk_prompt
+from app.services.tracer import span
+
+logger = logging.getLogger(__name__)
+
+_SECTION_RE = re.compile(r"^\s*<<\s*(\d+)\s*>>\s*$", re.MULTILINE)
+
+# 개별 청크 호출 설정 (pipeline의 map 호출과 동일)
+CHUNK_TEMPERATURE = 0.1
+CHUNK_NUM_PREDICT = 120
+CHUNK_TIMEOUT_SEC = 120
+
+# 배분 대상 지표: 묶음 호출 1회의 값을 섹션 수로 나눠 각 청크에 배분
+_SHARED_METRIC_KEYS = (
+    "prompt_eval_count", "eval_count",
+    "total_duration", "load_duration", "prompt_eval_duration", "eval_duration",
+)
+
+
+def chunk_options_hash(top_p: float) -> str:
+    """청크 요약 결과에 영향을 주는 설정. 저장된 청크 요약 재사용 시 키로 사용."""
+    opts = {"temperature": CHUNK_TEMPERATURE, "top_p": top_p, "num_predict": CHUNK_NUM_PREDICT}
+    return hashlib.sha256(json.dumps(opts, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def parse_sections(text: str, n: int) -> Dict[int, str]:
+    """'<<N>>' 줄로 시작하는 섹션들을 {번호: 본문}으로. 범위 밖/빈 섹션은 버림."""
+    out: Dict[int, str] = {}
+    marks = list(_SECTION_RE.finditer(text or ""))
+    for i, m in enumerate(marks):
+        idx = int(m.group(1))
+        end = marks[i + 1].start() if i + 1 < len(marks) else len(text)
+        body = text[m.end():end].strip()
+        if 1 <= idx <= n and body and idx not in out:
+            out[idx] = body
+    return out
+
+
+async def generate_chunk(model: str, text: str, top_p: float) -> dict:
+    tp = time.perf_counter()
+    prompt = build_chunk_prompt(text)
+    prompt_build_ms = (time.perf_counter() - tp) * 1000
+    data = await ollama_generate(
+        model=model,
+        prompt=prompt,
+        mode="default",
+        temperature=CHUNK_TEMPERATURE,
+        top_p=top_p,
+        num_predict=CHUNK_NUM_PREDICT,
+        timeout_sec=CHUNK_TIMEOUT_SEC,
+        stage="map",
+    )
+    # 응답 dict는 single-flight로 공유될 수 있으므로 복사본에 넣는다
+    return {**data, "prompt_build_ms": prompt_build_ms}
+
+
+class _Pending:
+    __slots__ = ("texts", "futures", "chars", "timer")
+
+    def __init__(self):
+        self.texts: List[str] = []
+        self.futures: List[asyncio.Future] = []
+        self.chars = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ChunkBatcher:
+    def __init__(
+        self,
+        window_ms: int = MAP_BATCH_WINDOW_MS,
+        max_sections: int = MAP_BATCH_MAX_SECTIONS,
+        max_chars: int = MAP_BATCH_MAX_CHARS,
+    ):
+        self.window_ms = window_ms
+        self.max_sections = max_sections
+        self.max_chars = max_chars
+        self._pending: Dict[Tuple[str, float], _Pending] = {}
+        # 실행 중인 묶음 호출 (참조를 잡아둬야 GC로 중간에 사라지지 않음)
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {
+            "batched": self._new_stats(),
+            "unbatched": self._new_stats(),
+        }
+        self.packed_calls = 0
+        self.parse_failures = 0
+        self.fallback_sections = 0
+
+    @staticmethod
+    def _new_stats() -> dict:
+        return {"chunks": 0, "calls": 0, "prompt_tokens": 0, "eval_tokens": 0, "latency_ms": 0.0}
+
+    # ── 외부 API ──────────────────────────────────────────────────────────
+    async def summarize(self, model: str, text: str, top_p: float, batch: bool = True) -> dict:
+        """
+        청크 1개 요약. 응답 형식은 ollama_generate와 같다(response + 지표).
+        batch=False면 바로 개별 호출(비교용 통계만 기록).
+        """
+        t0 = time.perf_counter()
+        if not batch:
+            data = await generate_chunk(model, text, top_p)
+            self._observe("unbatched", data, time.perf_counter() - t0, calls=1)
+            return data
+
+        # 한 섹션이 이미 묶음 한도를 넘으면 묶을 이유가 없음
+        if len(text) >= self.max_chars:
+            data = await generate_chunk(model, text, top_p)
+            self._observe("batched", data, time.perf_counter() - t0, calls=1)
+            return data
+
+        fut = asyncio.get_running_loop().create_future()
+        self._enqueue((model, top_p), text, fut)
+        data = await fut
+        self._observe("batched", data, time.perf_counter() - t0, calls=0)
+        return data
+
+    async def aclose(self) -> None:
+        """종료 시: 아직 보내지 않은 묶음과 실행 중인 묶음 호출을 모두 취소"""
+        for p in self._pending.values():
+            if p.timer is not None:
+                p.timer.cancel()
+            for fut in p.futures:
+                fut.cancel()
+        self._pending.clear()
+        tasks = list(self._tasks)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        out = {
+            "window_ms": self.window_ms,
+            "max_sections": self.max_sections,
+            "running_batches": len(self._tasks),
+            "packed_calls": self.packed_calls,
+            "parse_failures": self.parse_failures,
+            "fallback_sections": self.fallback_sections,
+        }
+        for name, s in self._stats.items():
+            n = max(1, s["chunks"])
+            out[name] = {
+                **s,
+                "latency_ms": round(s["latency_ms"], 1),
+                "prompt_tokens_per_chunk": round(s["prompt_tokens"] / n, 1),
+                "eval_tokens_per_chunk": round(s["eval_tokens"] / n, 1),
+                "latency_ms_per_chunk": round(s["latency_ms"] / n, 1),
+            }
+        return out
+
+    # ── 내부 ──────────────────────────────────────────────────────────────
+    def _observe(self, name: str, data: dict, elapsed_sec: float, calls: int) -> None:
+        s = self._stats[name]
+        s["chunks"] += 1
+        s["calls"] += calls
+        s["prompt_tokens"] += data.get("prompt_eval_count") or 0
+        s["eval_tokens"] += data.get("eval_count") or 0
+        s["latency_ms"] += elapsed_sec * 1000
+
+    def _enqueue(self, key: Tuple[str, float], text: str, fut: asyncio.Future) -> None:
+        p = self._pending.get(key)
+        if p is not None and p.chars + len(text) > self.max_chars:
+            self._flush(key)
+            p = None
+        if p is None:
+            p = _Pending()
+            self._pending[key] = p
+            # 타이머/묶음 호출은 여러 요청의 청크를 다루므로 먼저 들어온 요청의 트레이스에 붙지 않게 빈 컨텍스트로
+            p.timer = asyncio.get_running_loop().call_later(
+                self.window_ms / 1000, self._flush, key, context=contextvars.Context(),
+            )
+        p.texts.append(text)
+        p.futures.append(fut)
+        p.chars += len(text)
+        if len(p.texts) >= self.max_sections:
+            self._flush(key)
+
+    def _flush(self, key: Tuple[str, float]) -> None:
+        p = self._pending.pop(key, None)
+        if p is None:
+            return
+        if p.timer is not None:
+            p.timer.cancel()
+        loop = asyncio.get_running_loop()
+        task = contextvars.Context().run(loop.create_task, self._run(key, p.texts, p.futures))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        # _run은 오류를 대기 중인 future로 넘기므로 여기까지 오는 예외는 예상 밖
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("chunk batch task failed", exc_info=task.exception())
+
+    async def _run(self, key: Tuple[str, float], texts: List[str], futures: List[asyncio.Future]) -> None:
+        model, top_p = key
+        # 기다리던 요청이 이미 취소한 청크는 보내지 않는다
+        live = [(t, f) for t, f in zip(texts, futures) if not f.done()]
+        if not live:
+            return
+        texts, futures = [t for t, _ in live], [f for _, f in live]
+        try:
+            if len(texts) == 1:
+                _resolve(futures[0], await generate_chunk(model, texts[0], top_p))
+                self._stats["batched"]["calls"] += 1
+                return
+
+            tp = time.perf_counter()
+            prompt = build_packed_chunk_prompt(texts)
+            prompt_build_ms = (time.perf_counter() - tp) * 1000
+            with span("map.packed", sections=len(texts)):
+                data = await ollama_generate(
+                    model=model,
+                    prompt=prompt,
+                    mode="default",
+                    temperature=CHUNK_TEMPERATURE,
+                    top_p=top_p,
+                    num_predict=CHUNK_NUM_PREDICT * len(texts),
+                    timeout_sec=CHUNK_TIMEOUT_SEC,
+                    stage="map_packed",
+                )
+            self.packed_calls += 1
+            self._stats["batched"]["calls"] += 1
+
+            sections = parse_sections(data.get("response") or "", len(texts))
+            if data.get("done_reason") == "length" and sections:
+                # 길이 제한으로 끊겼으면 마지막 섹션은 미완성일 수 있으니 개별 호출로 돌린다
+                sections.pop(max(sections))
+            if len(sections) < len(texts):
+                self.parse_failures += 1
+            share = {k: data[k] // len(texts) for k in _SHARED_METRIC_KEYS if isinstance(data.get(k), int)}
+
+            missing = []
+            for i, fut in enumerate(futures, 1):
+                if i in sections:
+                    _resolve(fut, {
+                        **share,
+                        "response": sections[i],
+                        "done_reason": data.get("done_reason"),
+                        "packed_sections": len(texts),
+                        "prompt_build_ms": prompt_build_ms / len(texts),
+                    })
+                else:
+                    missing.append(i)
+
+            # 섹션을 못 찾은 청크는 개별 호출로 대체
+            if missing:
+                self.fallback_sections += len(missing)
+                self._stats["batched"]["calls"] += len(missing)
+                results = await asyncio.gather(
+                    *(generate_chunk(model, texts[i - 1], top_p) for i in missing),
+                    return_exceptions=True,
+                )
+                for i, r in zip(missing, results):
+                    _resolve(futures[i - 1], r)
+        except BaseException as e:
+            for fut in futures:
+                _resolve(fut, e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+
+def _resolve(fut: asyncio.Future, value) -> None:
+    # 요청자가 이미 취소했으면 무시
+    if fut.done():
+        return
+    if isinstance(value, asyncio.CancelledError):
+        fut.cancel()
+    elif isinstance(value, BaseException):
+        fut.set_exception(value)
+    else:
+        fut.set_result(value)
+
+
+chunk_batcher = ChunkBatcher()
@@ -0,0 +1,191 @@
+# num_predict_tuner.py
+"""
+관측된 eval_count / done_reason을 바탕으로 num_predict를 자동으로 정하는 컨트롤러입니다.
+(model, mode, stage)별로 최근 호출을 모아 목표 완료율(done_reason != "length")을 만족하는
+최소 토큰 예산을 계산하고, 학습된 값은 JSON 파일로 저장해 재시작 후에도 이어서 사용합니다.
+
+- 너무 낮으면: length로 끊겨 repair 호출을 한 번 더 하게 됨
+- 너무 높으면: 디코딩 시간이 늘어남(stop 토큰 전에 장황하게 생성)
+"""
+
+import json
+import math
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.core.config import (
+    NUM_PREDICT_AUTO,
+    NUM_PREDICT_TARGET_RATE,
+    NUM_PREDICT_TUNER_FILE,
+)
+
+# 입력 길이(프롬프트 글자 수) 구간. 구간별 샘플이 충분하면 구간 값, 아니면 전체 값 사용
+_INPUT_BUCKETS = (500, 1000, 2000, 4000)
+# length로 끊긴 호출은 실제로 필요한 토큰이 eval_count보다 크므로 보수적으로 부풀린다
+_LENGTH_INFLATE = 1.3
+
+Obs = Tuple[int, int, bool]  # (input_chars, eval_count, hit_length)
+
+
+def _bucket(input_chars: int) -> int:
+    for i, edge in enumerate(_INPUT_BUCKETS):
+        if input_chars < edge:
+            return i
+    return len(_INPUT_BUCKETS)
+
+
+def num_predict_bounds(mode: str) -> Tuple[Optional[int], Optional[int]]:
+    """ollama_generate가 모드별로 실제로 보내는 num_predict 범위 (None = 제한 없음)"""
+    if mode.startswith("news"):
+        return 120, 260  # 필요 이상 생성 방지
+    return None, None
+
+
+def _quantile(values: List[float], q: float) -> float:
+    s = sorted(values)
+    idx = min(len(s) - 1, max(0, math.ceil(q * len(s)) - 1))
+    return s[idx]
+
+
+class NumPredictTuner:
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        target_rate: float = 0.95,
+        window: int = 200,
+        min_samples: int = 20,
+        margin: float = 1.1,
+        floor: int = 32,
+        ceil: int = 1024,
+        save_every: int = 20,
+    ):
+        self.path = path
+        self.target_rate = target_rate
+        self.window = window
+        self.min_samples = min_samples
+        self.margin = margin
+        self.floor = floor
+        self.ceil = ceil
+        self.save_every = save_every
+        self._obs: Dict[str, Deque[Obs]] = {}
+        self._params: Dict[str, dict] = {}
+        self._since_save = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model: str, mode: str, stage: str) -> str:
+        return f"{model}|{mode}|{stage}"
+
+    # ── 관측 기록 ──────────────────────────────────────────────────────────
+    def record(
+        self,
+        model: str,
+        mode: str,
+        stage: str,
+        input_chars: int,
+        eval_count: Optional[int],
+        done_reason: Optional[str],
+        num_predict: int,
+    ) -> bool:
+        """관측 1건을 기록하고 파라미터를 다시 맞춘다. 저장할 때가 되면 True."""
+        if eval_count is None:
+            return False
+        k = self.key(model, mode, stage)
+        with self._lock:
+            dq = self._obs.setdefault(k, deque(maxlen=self.window))
+            dq.append((int(input_chars), int(eval_count), done_reason == "length"))
+            self._params[k] = self._fit(dq, mode, last_num_predict=num_predict)
+            self._since_save += 1
+            if self.path is not None and self._since_save >= self.save_every:
+                self._since_save = 0
+                return True
+        return False
+
+    def _fitted(self, obs: List[Obs]) -> int:
+        needed = [ev * _LENGTH_INFLATE if cut else ev for _, ev, cut in obs]
+        b = _quantile(needed, self.target_rate) * self.margin
+        return int(min(self.ceil, max(self.floor, math.ceil(b))))
+
+    def _bounds(self, mode: str) -> Tuple[int, int]:
+        lo, hi = num_predict_bounds(mode)
+        return max(self.floor, lo or 0), min(self.ceil, hi or self.ceil)
+
+    def _fit(self, dq: Deque[Obs], mode: str, last_num_predict: int) -> dict:
+        obs = list(dq)
+        n = len(obs)
+        completed = sum(1 for _, _, cut in obs if not cut)
+        lo, hi = self._bounds(mode)
+        params = {
+            "samples": n,
+            "completion_rate": round(completed / n, 3) if n else None,
+            "mean_eval_count": round(sum(ev for _, ev, _ in obs) / n, 1) if n else None,
+            "last_num_predict": last_num_predict,  # 실제로 보낸 값
+            "fitted": None,  # 관측만으로 계산한 값 (모드 범위 적용 전)
+            "budget": None,  # 모드 범위를 적용한, 실제로 보낼 값
+            "bounds": [lo, hi],
+            "buckets": {},
+            "updated_at": time.time(),
+        }
+        if n >= self.min_samples:
+            fitted = self._fitted(obs)
+            params["fitted"] = fitted
+            params["budget"] = min(hi, max(lo, fitted))
+            by_bucket: Dict[int, List[Obs]] = {}
+            for o in obs:
+                by_bucket.setdefault(_bucket(o[0]), []).append(o)
+            for b, items in by_bucket.items():
+                if len(items) >= self.min_samples:
+                    params["buckets"][str(b)] = min(hi, max(lo, self._fitted(items)))
+        return params
+
+    # ── 예산 제안 ──────────────────────────────────────────────────────────
+    def suggest(self, model: str, mode: str, stage: str, input_chars: int, default: int) -> int:
+        """학습된 예산. 샘플이 부족하면 호출부가 넘긴 기본값을 그대로 쓴다."""
+        p = self._params.get(self.key(model, mode, stage))
+        if not p or p.get("budget") is None:
+            return default
+        return p["buckets"].get(str(_bucket(input_chars)), p["budget"])
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": NUM_PREDICT_AUTO,
+                "target_rate": self.target_rate,
+                "min_samples": self.min_samples,
+                "input_buckets": list(_INPUT_BUCKETS),
+                "params": {k: dict(v) for k, v in self._params.items()},
+            }
+
+    # ── 영속화 ────────────────────────────────────────────────────────────
+    def save(self) -> None:
+        if self.path is None:
+            return
+        # to_thread에서 호출되는 동안 record()가 dict를 바꿀 수 있으므로 직렬화까지 잠금 안에서
+        with self._lock:
+            text = json.dumps({
+                "params": self._params,
+                "obs": {k: list(dq) for k, dq in self._obs.items()},
+            }, ensure_ascii=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(text, encoding="utf-8")
+        tmp.replace(self.path)
+
+    def load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for k, items in (data.get("obs") or {}).items():
+                self._obs[k] = deque((tuple(o) for o in items), maxlen=self.window)
+            self._params = data.get("params") or {}
+
+
+tuner = NumPredictTuner(path=NUM_PREDICT_TUNER_FILE, target_rate=NUM_PREDICT_TARGET_RATE)
+tuner.load()
@@ -5,30 +5,64 @@ Ollama 모델을 안정적으로 호출하는 래퍼입니다.
 모델이 불필요한 문단을 작성하는 것을 방지합니다.
 """
 
+import time
+import json
+import asyncio
+import hashlib
 import httpx
 from fastapi import HTTPException
 from typing import Any, Dict, Optional
 
-OLLAMA_BASE_URL = "http://localhost:11434"
-_client: Optional[httpx.AsyncClient] = None
+from app.core.config import NUM_PREDICT_AUTO
+from app.services.tracer import span
+from app.services.num_predict_tuner import tuner, num_predict_bounds
+from app.services.singleflight import SingleFlight
+from app.services.ollama_recorder import recorder
+from app.services.ollama_transport import ollama_transport
+from app.services.prompt_registry import prompt_registry, RenderedPrompt
 
-def get_client(timeout_sec: int) -> httpx.AsyncClient:
-    global _client
-    if _client is None:
-        _client = httpx.AsyncClient(
-            timeout=httpx.Timeout(timeout_sec),
-            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20),
-        )
-    return _client
+generate_flight = SingleFlight("ollama_generate")
 
 def _stop_for_mode(mode: str) -> list[str]:
     if mode.startswith("news"):
         return ["\n\n\n", "\n###", "\n---"]
     return ["\n\n\n", "\n###", "\n---"]
 
+def generation_budget(mode: str, num_predict: int) -> tuple[int, int]:
+    """모드별 (num_ctx, num_predict). 프롬프트를 컨텍스트 예산에 맞출 때도 같은 값을 사용"""
+    lo, hi = num_predict_bounds(mode)
+    if lo is not None:
+        num_predict = max(num_predict, lo)
+    if hi is not None:
+        num_predict = min(num_predict, hi)
+    return (2048 if mode.startswith("news") else 4096), num_predict
+
+# 성능 검증 디버깅
+def _ns_to_ms(v):
+    return None if v is None else int(v / 1_000_000)
+
+def pick_ollama_metrics(d: dict) -> dict:
+    out = {}
+    for k in ["done_reason", "prompt_eval_count", "eval_count"]:
+        if k in d:
+            out[k] = d.get(k)
+
+    for k in ["total_duration", "load_duration", "prompt_eval_duration", "eval_duration"]:
+        if k in d:
+            out[k] = _ns_to_ms(d.get(k))
 
+    # tok/s 추가
+    ev = out.get("eval_count")
+    ev_ms = out.get("eval_duration")
+    if ev is not None and ev_ms:
+        out["tok_per_sec"] = round(ev / (ev_ms / 1000), 2)
 
+    pv = out.get("prompt_eval_count")
+    pv_ms = out.get("prompt_eval_duration")
+    if pv is not None and pv_ms:
+        out["prompt_tok_per_sec"] = round(pv / (pv_ms / 1000), 2)
 
+    return out
 
 async def ollama_generate(
     model: str,
@@ -39,13 +73,16 @@ async def ollama_generate(
     num_predict: int = 200,
     timeout_sec: int = 180,
     keep_alive: str = "30m",
+    stage: Optional[str] = None,
 ) -> Dict[str, Any]:
+    # stage가 주어지면 (model, mode, stage)별로 eval_count/done_reason을 학습하고,
+    # NUM_PREDICT_AUTO가 켜져 있으면 넘겨받은 num_predict 대신 학습된 예산을 사용
+    if stage and NUM_PREDICT_AUTO:
+        num_predict = tuner.suggest(model, mode, stage, len(prompt), default=num_predict)
+
+    num_ctx, num_predict = generation_budget(mode, num_predict)
     if mode.startswith("news"):
-        num_ctx = 2048
-        num_predict = min(max(num_predict, 120), 260)  # 필요 이상 생성 방지
         temperature = min(temperature, 0.2)
-    else:
-        num_ctx = 4096
 
     payload = {
         "model": model,
@@ -62,12 +99,57 @@ async def ollama_generate(
         },
     }
 
+    # 동일 payload가 동시에 들어오면 HTTP 호출은 한 번만 (single-flight)
+    key = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    template = getattr(prompt, "template_id", None)
+    with span("ollama.generate", model=model, mode=mode, num_predict=num_predict, prompt_chars=len(prompt),
+              template=template) as sp:
+        started_at = time.time()
+        t0 = time.perf_counter()
+        data, shared = await generate_flight.do(key, lambda: _post_generate(payload, timeout_sec))
+        wall_ms = (time.perf_counter() - t0) * 1000
+
+        if sp is not None:
+            metrics = pick_ollama_metrics(data)
+            # Ollama가 보고한 total_duration과 실제 왕복 시간의 차이 = 전송/큐잉/직렬화 오버헤드
+            ollama_ms = metrics.get("total_duration") or 0
+            sp.set(**metrics, wall_ms=round(wall_ms, 1), overhead_ms=round(wall_ms - ollama_ms, 1), coalesced=shared)
+
+    # 합류한 호출은 실제 Ollama 호출이 아니므로 기록/관측하지 않음
+    if not shared and recorder.enabled:
+        recorder.record(
+            started_at=started_at, stage=stage, payload=payload, data=data,
+            metrics=pick_ollama_metrics(data), wall_ms=wall_ms,
+        )
+
+    # 템플릿별 프롬프트 토큰/prompt-eval 시간 통계 + 모델별 토큰 추정 보정
+    if isinstance(prompt, RenderedPrompt) and not shared:
+        prompt_registry.observe(prompt, model, pick_ollama_metrics(data))
+
+    if stage and not shared:
+        save_due = tuner.record(
+            model, mode, stage, len(prompt),
+            eval_count=data.get("eval_count"),
+            done_reason=data.get("done_reason"),
+            num_predict=num_predict,
+        )
+        if save_due:
+            await asyncio.to_thread(tuner.save)
+    return data
+
+
+async def _post_generate(payload: dict, timeout_sec: int) -> Dict[str, Any]:
     try:
-        client = get_client(timeout_sec)
-        r = await client.post(f"{OLLAMA_BASE_URL}/api/generate", json=payload)
+        r = await ollama_transport.post_json("/api/generate", payload, timeout_sec)
         r.raise_for_status()
         return r.json()
     except httpx.ConnectError:
         raise HTTPException(status_code=503, detail="Ollama server is not reachable (is ollama running?)")
+    except httpx.PoolTimeout:
+        # Ollama가 느린 게 아니라 우리 쪽 커넥션 풀에서 기다리다 끝난 경우
+        raise HTTPException(status_code=503, detail="Timed out waiting for a free Ollama connection (pool exhausted).")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=504, detail=f"Ollama did not respond within {timeout_sec}s.")
     except httpx.HTTPStatusError as e:
         raise HTTPException(status_code=502, detail=f"Ollama error: {e.response.text}")
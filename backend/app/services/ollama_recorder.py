@@ -0,0 +1,136 @@
+# ollama_recorder.py
+"""
+Ollama 호출 기록기입니다. (옵트인: SIFT_RECORD_DIR 설정 시에만 동작)
+실제 트래픽의 프롬프트 크기/출력 길이/도착 간격을 그대로 남겨두고,
+`python -m app.tools.replay`로 다른 모델·옵션에 재생해 비교하는 데 사용합니다.
+
+- 한 줄 = 호출 1건 (JSON), gzip 압축, 일정 건수마다 새 파일로 교체
+- 파일 쓰기는 별도 스레드에서 하므로 요청 경로에서는 큐에 넣기만 함
+- 최대 FLUSH_INTERVAL_SEC마다 gzip 스트림을 Z_SYNC_FLUSH로 내려써서, 프로세스가 죽어도 그 전 기록은 읽을 수 있음
+- 기본은 프롬프트 해시만 저장, SIFT_RECORD_FULL_PROMPT=1이면 원문까지 저장(재생하려면 필요)
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+from app.core.config import RECORD_DIR, RECORD_FULL_PROMPT, RECORD_MAX_PER_FILE
+
+logger = logging.getLogger(__name__)
+
+# 기록이 디스크에 반영되기까지 최대 지연 (유휴 상태에서도 이 주기로 깨어나 내려씀)
+FLUSH_INTERVAL_SEC = 1.0
+
+
+class OllamaRecorder:
+    def __init__(self, directory: Optional[Path], full_prompt: bool = False, max_per_file: int = 5000):
+        self.directory = directory
+        self.full_prompt = full_prompt
+        self.max_per_file = max_per_file
+        self._queue: "queue.SimpleQueue[Optional[dict]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self.recorded = 0
+        self.dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="sift-recorder", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def record(
+        self,
+        *,
+        started_at: float,
+        stage: Optional[str],
+        payload: dict,
+        data: dict,
+        metrics: dict,
+        wall_ms: float,
+    ) -> None:
+        if self._thread is None:
+            return
+        prompt = payload.get("prompt") or ""
+        entry = {
+            "ts": started_at,
+            "stage": stage,
+            "template": getattr(prompt, "template_id", None),
+            "model": payload.get("model"),
+            "keep_alive": payload.get("keep_alive"),
+            "options": payload.get("options"),
+            "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "prompt_chars": len(prompt),
+            "response": data.get("response"),
+            "metrics": metrics,
+            "wall_ms": round(wall_ms, 1),
+        }
+        if self.full_prompt:
+            entry["prompt"] = prompt
+        self._queue.put(entry)
+
+    def _open_new(self):
+        name = time.strftime("ollama-%Y%m%d-%H%M%S", time.localtime()) + f"-{int(time.time() * 1000) % 1000:03d}.jsonl.gz"
+        return gzip.open(self.directory / name, "ab")
+
+    def _run(self) -> None:
+        f, written = None, 0
+        dirty, last_flush = False, time.monotonic()
+        try:
+            while True:
+                try:
+                    entry = self._queue.get(timeout=FLUSH_INTERVAL_SEC)
+                except queue.Empty:
+                    entry = False  # 유휴: 쌓인 기록만 내려씀
+                if entry is None:
+                    return
+                try:
+                    if entry:
+                        if f is None or written >= self.max_per_file:
+                            if f is not None:
+                                f.close()
+                            f, written = self._open_new(), 0
+                        f.write((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+                        written += 1
+                        self.recorded += 1
+                        dirty = True
+                    if dirty and (entry is False or time.monotonic() - last_flush >= FLUSH_INTERVAL_SEC):
+                        # 줄 경계에서 deflate 블록을 닫아 두면 잘린 파일도 여기까지는 온전히 읽힘
+                        f.flush(zlib.Z_SYNC_FLUSH)
+                        dirty, last_flush = False, time.monotonic()
+                except OSError:
+                    self.dropped += 1
+                    logger.exception("failed to write ollama recording")
+        finally:
+            if f is not None:
+                f.close()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "directory": str(self.directory) if self.directory else None,
+            "full_prompt": self.full_prompt,
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+        }
+
+
+recorder = OllamaRecorder(RECORD_DIR, full_prompt=RECORD_FULL_PROMPT, max_per_file=RECORD_MAX_PER_FILE)
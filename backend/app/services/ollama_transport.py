@@ -0,0 +1,126 @@
+# ollama_transport.py
+"""
+Ollama 서버와의 연결(httpx 클라이언트)을 관리하는 전송 계층입니다.
+FastAPI lifespan에서 열고 닫으며, 호출마다 타임아웃을 따로 지정할 수 있습니다.
+
+- 커넥션 풀 크기/keep-alive 만료를 설정으로 조정
+- 같은 호스트에서 Ollama를 돌리면 Unix 도메인 소켓(OLLAMA_UDS)으로 TCP 오버헤드 제거
+- HTTP/2(OLLAMA_HTTP2=1, h2 패키지 필요)로 연결 하나에 요청 다중화
+- 풀 통계(idle/active/대기 중 요청)를 노출해 "Ollama가 느림"과 "풀 대기"를 구분
+"""
+
+import importlib.util
+from typing import Optional
+
+import httpx
+
+from app.core.config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_UDS,
+    OLLAMA_HTTP2,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_MAX_KEEPALIVE,
+    OLLAMA_KEEPALIVE_EXPIRY,
+    OLLAMA_CONNECT_TIMEOUT,
+)
+
+
+class OllamaTransport:
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        uds: Optional[str] = OLLAMA_UDS,
+        http2: bool = OLLAMA_HTTP2,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+        max_keepalive: int = OLLAMA_MAX_KEEPALIVE,
+        keepalive_expiry: float = OLLAMA_KEEPALIVE_EXPIRY,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+    ):
+        self.base_url = base_url
+        self.uds = uds
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self._transport: Optional[httpx.AsyncHTTPTransport] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.in_flight = 0
+        self.requests = 0
+        self.pool_timeouts = 0
+
+    # ── 수명 관리 ─────────────────────────────────────────────────────────
+    def open(self) -> None:
+        if self._client is not None:
+            return
+        if self.http2 and importlib.util.find_spec("h2") is None:
+            raise RuntimeError("OLLAMA_HTTP2=1 requires the 'h2' package (pip install h2).")
+        self._transport = httpx.AsyncHTTPTransport(
+            uds=self.uds,
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+        )
+        self._client = httpx.AsyncClient(base_url=self.base_url, transport=self._transport)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+        self._client = None
+        self._transport = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # lifespan 밖(스크립트 등)에서 호출되면 그때 연다
+        if self._client is None:
+            self.open()
+        return self._client
+
+    # ── 호출 ──────────────────────────────────────────────────────────────
+    def timeout(self, timeout_sec: float) -> httpx.Timeout:
+        # 연결은 짧게, 읽기/풀 대기는 호출별 값
+        return httpx.Timeout(timeout_sec, connect=min(self.connect_timeout, timeout_sec))
+
+    async def post_json(self, path: str, payload: dict, timeout_sec: float) -> httpx.Response:
+        self.in_flight += 1
+        self.requests += 1
+        try:
+            return await self.client.post(path, json=payload, timeout=self.timeout(timeout_sec))
+        except httpx.PoolTimeout:
+            self.pool_timeouts += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    # ── 통계 ──────────────────────────────────────────────────────────────
+    def stats(self) -> dict:
+        out = {
+            "base_url": self.base_url,
+            "uds": self.uds,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "open": self._client is not None,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "pool_timeouts": self.pool_timeouts,
+        }
+        # httpcore 풀 내부 상태 (비공개 속성이라 없으면 생략)
+        pool = getattr(self._transport, "_pool", None)
+        if pool is not None:
+            conns = list(getattr(pool, "connections", []))
+            reqs = list(getattr(pool, "_requests", []))
+            idle = sum(1 for c in conns if c.is_idle())
+            out.update({
+                "connections": len(conns),
+                "idle": idle,
+                "active": len(conns) - idle,
+                "waiters": sum(1 for r in reqs if r.is_queued()),
+            })
+        return out
+
+
+ollama_transport = OllamaTransport()
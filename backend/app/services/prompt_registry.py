@@ -0,0 +1,392 @@
+# prompt_registry.py
+"""
+버전이 붙은 프롬프트 템플릿 레지스트리입니다.
+
+- 템플릿 = 고정 앞부분(역할/규칙/출력 형식) + 가변 뒷부분(원문, 현재 불릿 등)
+  고정부를 항상 앞에 두므로 Ollama가 이전 호출의 KV 캐시(prefix)를 그대로 재사용할 수 있음
+- 모델별 토큰 수 추정: 글자 수 기반 휴리스틱에 실제 prompt_eval_count로 보정 계수를 학습
+- num_ctx - num_predict - 고정부 토큰을 넘지 않도록 가변 텍스트(원문)를 자동으로 잘라 넣음
+  (Ollama는 컨텍스트를 넘으면 앞부분, 즉 지시문부터 버리므로 여기서 미리 맞춤)
+- 템플릿별 프롬프트 토큰/prompt-eval 시간 통계를 /api/metrics에 노출
+"""
+
+import math
+import re
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+_HANGUL_RE = re.compile(r"[가-힣㄰-㆏一-鿿]")
+
+# 컨텍스트 예산에서 남겨둘 여유 토큰 (추정 오차/채팅 템플릿 토큰)
+SAFETY_TOKENS = 32
+# 보정 계수 학습: 최근 표본의 상위 분위를 사용
+# (prefix 캐시가 맞으면 prompt_eval_count가 새로 평가한 토큰만 보고되어 낮게 나오므로 하위 값은 무시)
+CALIBRATION_WINDOW = 64
+CALIBRATION_MIN_SAMPLES = 5
+CALIBRATION_QUANTILE = 0.9
+
+
+def estimate_tokens(text: str) -> float:
+    """보정 전 토큰 수 추정. 한글/한자는 글자당 약 0.8토큰, 그 외는 4글자당 1토큰."""
+    if not text:
+        return 0.0
+    cjk = len(_HANGUL_RE.findall(text))
+    return cjk * 0.8 + (len(text) - cjk) / 4
+
+
+class RenderedPrompt(str):
+    """
+    렌더링된 프롬프트 문자열. 일반 str처럼 쓰이고, ollama_generate가
+    어떤 템플릿으로 만들어졌는지 알아내 통계를 남길 수 있도록 정보를 함께 가진다.
+    """
+
+    template_id: str
+    est_tokens: int
+    static_tokens: int
+    truncated_chars: int
+
+    def __new__(cls, text: str, template_id: str, est_tokens: int, static_tokens: int, truncated_chars: int = 0):
+        obj = super().__new__(cls, text)
+        obj.template_id = template_id
+        obj.est_tokens = est_tokens
+        obj.static_tokens = static_tokens
+        obj.truncated_chars = truncated_chars
+        return obj
+
+
+class PromptTemplate:
+    """
+    prefix: 호출마다 동일한 고정 지시문
+    body: 가변 부분 (str.format 자리표시자)
+    fit: 예산을 넘으면 잘라낼 변수 이름과 남길 쪽("head"=앞부분 유지, "tail"=뒷부분 유지)
+    """
+
+    def __init__(self, name: str, version: int, prefix: str, body: str, fit: Optional[Tuple[str, str]] = None):
+        self.name = name
+        self.version = version
+        self.prefix = prefix.strip()
+        self.body = body.strip()
+        self.fit = fit
+        self.fields = set(re.findall(r"{(\w+)}", self.body))
+
+    @property
+    def id(self) -> str:
+        return f"{self.name}@v{self.version}"
+
+    def skeleton(self) -> str:
+        """변수를 모두 비운 렌더링 결과 = 고정 토큰 비용"""
+        return self._join(self.body.format(**{k: "" for k in self.fields}))
+
+    def _join(self, body: str) -> str:
+        return f"{self.prefix}\n\n{body}"
+
+
+class PromptRegistry:
+    def __init__(self):
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._ratios: Dict[str, Deque[float]] = {}
+        self._factor: Dict[str, float] = {}
+        self._static_cost: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._stats: Dict[str, dict] = {}
+        self._models: Set[str] = set()  # 렌더링/관측에서 본 모델 (템플릿별 고정 비용 표시용)
+
+    def register(self, template: PromptTemplate) -> PromptTemplate:
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> PromptTemplate:
+        try:
+            return self._templates[name]
+        except KeyError:
+            raise ValueError(f"Unknown prompt template: {name}")
+
+    # ── 토큰 추정 ─────────────────────────────────────────────────────────
+    def factor(self, model: Optional[str]) -> float:
+        return self._factor.get(model or "", 1.0)
+
+    def count_tokens(self, text: str, model: Optional[str] = None) -> int:
+        return int(math.ceil(estimate_tokens(text) * self.factor(model)))
+
+    def static_tokens(self, name: str, model: Optional[str] = None) -> int:
+        """템플릿 고정부의 모델별 토큰 비용 (보정 계수가 바뀔 때만 다시 계산)"""
+        t = self.get(name)
+        f = self.factor(model)
+        cached = self._static_cost.get((t.id, model or ""))
+        if cached is None or cached[0] != f:
+            cached = (f, self.count_tokens(t.skeleton(), model))
+            self._static_cost[(t.id, model or "")] = cached
+        return cached[1]
+
+    # ── 렌더링 ────────────────────────────────────────────────────────────
+    def render(
+        self,
+        name: str,
+        *,
+        model: Optional[str] = None,
+        num_ctx: Optional[int] = None,
+        num_predict: int = 0,
+        **values,
+    ) -> RenderedPrompt:
+        """
+        템플릿을 채워 프롬프트를 만든다.
+        num_ctx가 주어지면 (num_ctx - num_predict - 고정부 - 다른 변수) 토큰 안에 들어가도록
+        fit 변수를 잘라낸다.
+        """
+        t = self.get(name)
+        if model:
+            self._models.add(model)
+        values = {k: str(v) for k, v in values.items()}
+        static = self.static_tokens(name, model)
+        truncated = 0
+
+        if num_ctx and t.fit:
+            var, keep = t.fit
+            text = values.get(var, "")
+            others = sum(self.count_tokens(v, model) for k, v in values.items() if k != var)
+            budget = num_ctx - num_predict - static - others - SAFETY_TOKENS
+            fitted = self._fit_text(text, max(0, budget), keep, model)
+            truncated = len(text) - len(fitted)
+            values[var] = fitted
+
+        prompt = t._join(t.body.format(**values))
+        return RenderedPrompt(prompt, t.id, self.count_tokens(prompt, model), static, truncated)
+
+    def _fit_text(self, text: str, budget: int, keep: str, model: Optional[str]) -> str:
+        tokens = self.count_tokens(text, model)
+        if tokens <= budget:
+            return text
+        # 글자당 토큰 비율로 먼저 자르고, 그래도 넘치면 10%씩 줄임
+        n = int(len(text) * budget / tokens)
+        while n > 0:
+            cut = text[:n] if keep == "head" else text[-n:]
+            if self.count_tokens(cut, model) <= budget:
+                return cut
+            n = int(n * 0.9)
+        return ""
+
+    # ── 관측/통계 ─────────────────────────────────────────────────────────
+    def observe(self, prompt: RenderedPrompt, model: str, metrics: dict) -> None:
+        """ollama_generate 응답 지표(pick_ollama_metrics 결과)로 템플릿 통계와 모델 보정 계수를 갱신"""
+        observed = metrics.get("prompt_eval_count")
+        self._models.add(model)
+        s = self._stats.setdefault(prompt.template_id, {
+            "calls": 0, "prompt_tokens": 0, "est_tokens": 0, "prompt_eval_ms": 0,
+            "truncated": 0, "truncated_chars": 0, "static_tokens": {},
+        })
+        s["calls"] += 1
+        s["prompt_tokens"] += observed or 0
+        s["est_tokens"] += prompt.est_tokens
+        s["prompt_eval_ms"] += metrics.get("prompt_eval_duration") or 0
+        if prompt.truncated_chars:
+            s["truncated"] += 1
+            s["truncated_chars"] += prompt.truncated_chars
+        s["static_tokens"][model] = prompt.static_tokens
+
+        raw = estimate_tokens(prompt)
+        if observed and raw > 0:
+            ratios = self._ratios.setdefault(model, deque(maxlen=CALIBRATION_WINDOW))
+            ratios.append(observed / raw)
+            if len(ratios) >= CALIBRATION_MIN_SAMPLES:
+                ordered = sorted(ratios)
+                idx = min(len(ordered) - 1, int(CALIBRATION_QUANTILE * len(ordered)))
+                self._factor[model] = round(min(3.0, max(0.3, ordered[idx])), 3)
+
+    def describe(self) -> List[dict]:
+        """
+        등록된 템플릿별 구성(고정부/가변 필드/잘라낼 필드)과 고정부 토큰 비용.
+        비용은 보정 전 휴리스틱("*")과 지금까지 본 모델별 값 (트래픽 전에도 확인 가능)
+        """
+        out = []
+        for name, t in sorted(self._templates.items()):
+            cost = {"*": self.static_tokens(name)}
+            for model in sorted(self._models):
+                cost[model] = self.static_tokens(name, model)
+            out.append({
+                "template": t.id,
+                "prefix_chars": len(t.prefix),
+                "fields": sorted(t.fields),
+                "fit": {"field": t.fit[0], "keep": t.fit[1]} if t.fit else None,
+                "static_tokens": cost,
+            })
+        return out
+
+    def stats(self) -> dict:
+        templates = []
+        for tid, s in self._stats.items():
+            n = max(1, s["calls"])
+            templates.append({
+                "template": tid,
+                **s,
+                "prompt_tokens_avg": round(s["prompt_tokens"] / n, 1),
+                "est_tokens_avg": round(s["est_tokens"] / n, 1),
+                "prompt_eval_ms_avg": round(s["prompt_eval_ms"] / n, 1),
+            })
+        # prompt-eval 시간을 가장 많이 쓴 템플릿부터
+        templates.sort(key=lambda x: x["prompt_eval_ms"], reverse=True)
+        return {
+            "registered": self.describe(),
+            "token_factor": dict(self._factor),
+            "templates": templates,
+        }
+
+
+prompt_registry = PromptRegistry()
+
+# ── 템플릿 정의 ───────────────────────────────────────────────────────────
+prompt_registry.register(PromptTemplate(
+    "news", 1,
+    prefix="""
+[Role]
+당신은 뉴스 기사의 핵심 수치와 사실관계를 왜곡 없이 전달하는 한국어 요약 전문가입니다.
+
+[Task]
+제시된 '원문'을 바탕으로 반드시 5개의 불릿포인트(-)로 요약하세요.
+
+[Rules]
+1. 한국어로만 작성하세요.
+2. 각 문장은 팩트 중심의 평서문(~다. 체)으로 끝내세요.
+3. 원문에 없는 숫자를 지어내거나 추측하지 마세요 (Hallucination 금지).
+4. 고유명사, 날짜, 금액 등 핵심 수치는 원문 그대로 유지하세요.
+5. 서두나 인사말 없이 결과만 출력하세요.
+6. 각 줄은 '- '로 시작하세요.
+7. 5줄을 초과해 출력하지 마세요.
+
+[Self-check]
+출력 직전에 불릿 줄 수를 세어라.
+- 불릿이 5개가 아니면, 스스로 수정해서 정확히 5개로 맞춘 뒤 출력하라.
+
+[Output Format]
+- 핵심 내용 1
+- 핵심 내용 2
+- 핵심 내용 3
+- 핵심 내용 4
+- 핵심 내용 5
+""",
+    body="""
+[원문]
+{text}
+""",
+    fit=("text", "head"),
+))
+
+prompt_registry.register(PromptTemplate(
+    "chunk", 1,
+    prefix="""
+아래 내용을 한국어로 간결하게 요약해라.
+
+규칙:
+- 한국어만 사용한다.
+- 원문에 없는 내용을 추가하지 않는다.
+- 핵심 내용을 3~5문장 이내로 전달한다.
+- 고유명사/수치/연도는 원문 그대로 유지한다.
+- 서두나 인사는 쓰지 않는다.
+""",
+    body="""
+[본문]
+{text}
+""",
+    fit=("text", "head"),
+))
+
+# 섹션 수는 가변이므로 지시문에서 빼고 본문 앞에 둔다 (고정부를 모든 묶음 호출이 공유)
+prompt_registry.register(PromptTemplate(
+    "packed", 2,
+    prefix="""
+아래 [[섹션 N]]으로 구분된 글들을 서로 섞지 말고 각각 한국어로 간결하게 요약해라.
+
+규칙:
+- 한국어만 사용한다.
+- 원문에 없는 내용을 추가하지 않는다.
+- 섹션마다 핵심 내용을 3~5문장 이내로 전달한다.
+- 고유명사/수치/연도는 원문 그대로 유지한다.
+- 서두나 인사는 쓰지 않는다.
+- 각 섹션 요약은 "<<번호>>" 한 줄로 시작하고, 그 아래에 해당 섹션의 요약만 쓴다.
+- <<1>>부터 마지막 섹션 번호까지 빠짐없이 순서대로 출력한다.
+""",
+    body="""
+섹션 수: {count} (<<1>>부터 <<{count}>>까지)
+
+{sections}
+""",
+))
+
+prompt_registry.register(PromptTemplate(
+    "report", 2,
+    prefix="아래 내용을 한국어로 구조화 요약해라.",
+    body="""
+[원문]
+{text}
+""",
+    fit=("text", "head"),
+))
+
+prompt_registry.register(PromptTemplate(
+    "default", 2,
+    prefix="아래 텍스트를 한국어로 5줄 이내로 요약하라.",
+    body="""
+[원문]
+{text}
+""",
+    fit=("text", "head"),
+))
+
+# continue/repair: 규칙을 앞으로, 현재 불릿/남은 줄 수/원문 발췌를 뒤로
+prompt_registry.register(PromptTemplate(
+    "continue", 3,
+    prefix="""
+당신은 뉴스 기사의 핵심 수치와 사실관계를 왜곡 없이 전달하는 한국어 요약 전문가입니다.
+[현재까지 작성한 불릿]에 이어 남은 불릿을 추가하세요.
+
+금지:
+- [현재까지 작성한 불릿]에서 이미 언급된 '숫자/연도/계약건수/승인건수/서비스명/사업명'을 다시 쓰지 마라.
+- 같은 사실을 다른 말로 반복하지 마라.
+
+규칙:
+1. 한국어로만 작성
+2. 문장은 평서문(~다. 체)으로 끝낼 것
+3. 원문에 없는 숫자·정보를 추가하지 말 것
+4. 고유명사·날짜·금액 등 핵심 수치는 원문 그대로 유지
+5. 서두나 인사 없이 결과만 출력
+6. 각 줄은 “- ”로 시작
+7. “마지막 불릿이 문장 중간에서 끝났으면, 그 불릿을 먼저 완성하고 나머지 불릿을 작성하라.”
+""",
+    body="""
+[현재까지 작성한 불릿]
+{existing}
+
+남은 불릿 {remain}줄을 추가하세요.
+
+[원문 뒤쪽 발췌]
+{article_tail}
+""",
+    fit=("article_tail", "tail"),
+))
+
+prompt_registry.register(PromptTemplate(
+    "repair", 2,
+    prefix="""
+당신은 뉴스 기사의 사실/수치를 왜곡 없이 전달하는 한국어 요약 전문가입니다.
+
+아래 '현재 불릿'은 마지막 문장이 끊겼거나 불완전할 수 있습니다.
+[원문 뒤쪽 발췌]를 참고해 사실/수치를 유지하면서,
+불릿 5줄을 완전한 문장으로 다시 작성하세요.
+
+규칙:
+1. 한국어만
+2. 정확히 5줄
+3. 각 줄은 "- "로 시작
+4. 원문에 없는 정보/숫자 추가 금지
+5. 중복 금지
+6. 각 문장은 "~다."로 끝내기
+7. 마지막 불릿이 끊겼다면 먼저 자연스럽게 완성할 것
+8. 서두/인사 없이 결과만 출력
+""",
+    body="""
+[현재 불릿]
+{existing}
+
+[원문 뒤쪽 발췌]
+{article_tail}
+""",
+    fit=("article_tail", "tail"),
+))
@@ -0,0 +1,70 @@
+# singleflight.py
+"""
+동일한 작업이 동시에 여러 번 요청될 때 실제 계산은 한 번만 하고 결과를 나눠주는 single-flight 도우미입니다.
+같은 기사를 여러 편집자가 거의 동시에 올리는 경우 map-reduce 전체를 중복 실행하지 않게 합니다.
+
+- 계산은 첫 요청(leader)과 분리된 별도 태스크에서 돌기 때문에, leader 클라이언트가 끊겨도
+  기다리는 다른 요청이 있으면 계속 진행됩니다.
+- 기다리는 요청이 모두 취소되면 그때 계산 태스크도 취소합니다.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, _Call] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        key가 같은 진행 중 작업이 있으면 거기에 합류하고, 없으면 fn()을 새로 시작한다.
+        반환값: (결과, 합류 여부)
+        """
+        call = self._inflight.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._inflight[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget(k, c))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task), shared
+        except asyncio.CancelledError:
+            # 이 요청만 빠지는 것. 마지막 대기자였다면 계산도 중단
+            if call.waiters == 1 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+                self.cancelled += 1
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: _Call) -> None:
+        # 취소 직후 같은 key로 새 요청이 들어오면 취소 중인 태스크에 붙지 않도록 바로 제거
+        if self._inflight.get(key) is call:
+            del self._inflight[key]
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
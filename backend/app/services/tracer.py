@@ -0,0 +1,187 @@
+# tracer.py
+"""
+요청 단위 스팬 트레이서와 샘플링 프로파일러입니다.
+라우터/서비스 곳곳에서 `with span("이름"):`으로 구간을 감싸면 요청별 트리가 만들어지고,
+디버그 플래그가 켜진 경우 응답에 포함하거나 로컬 JSONL 파일에 추가 기록합니다.
+트레이스가 시작되지 않은 상태에서는 span()이 아무 일도 하지 않으므로 평소 오버헤드는 거의 없습니다.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from app.core.config import TRACE_FILE
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children")
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.attrs: Dict[str, Any] = dict(attrs or {})
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.children: List["Span"] = []
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self, origin: Optional[float] = None) -> dict:
+        origin = self.start if origin is None else origin
+        out = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(self.duration_ms, 2),
+        }
+        if self.attrs:
+            out["attrs"] = self.attrs
+        if self.children:
+            out["children"] = [c.to_dict(origin) for c in self.children]
+        return out
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("sift_current_span", default=None)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    현재 트레이스에 자식 스팬을 추가합니다. 트레이스가 없으면 None을 넘기고 끝.
+    asyncio.gather로 만든 태스크도 컨텍스트를 복사하므로 부모 아래에 그대로 붙습니다.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    s = Span(name, attrs)
+    parent.children.append(s)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+@contextmanager
+def start_trace(name: str, enabled: bool = True, **attrs):
+    """
+    요청 루트 스팬을 시작합니다. enabled=False면 트레이스를 만들지 않습니다.
+    """
+    if not enabled:
+        yield None
+        return
+
+    root = Span(name, attrs)
+    token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        _current_span.reset(token)
+
+
+_trace_file_lock = threading.Lock()
+
+
+def append_trace_file(trace: dict, path: Optional[str] = None) -> None:
+    """트레이스 트리를 JSONL 한 줄로 추가합니다. 경로가 없으면 무시."""
+    path = path or TRACE_FILE
+    if not path:
+        return
+    line = json.dumps({"ts": time.time(), "trace": trace}, ensure_ascii=False)
+    with _trace_file_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+# ── 샘플링 프로파일러 ─────────────────────────────────────────────────────
+class SamplingProfiler:
+    """
+    별도 스레드에서 대상 스레드(기본: 이벤트 루프 스레드)의 스택을 주기적으로 샘플링합니다.
+    cProfile과 달리 await 경계에 영향을 받지 않고, 샘플 간격만큼의 오버헤드만 추가됩니다.
+    같은 루프에서 동시에 돌고 있는 다른 요청의 CPU 사용도 함께 잡힌다는 점에 유의.
+    """
+
+    def __init__(self, interval_sec: float = 0.005, max_depth: int = 40):
+        self.interval_sec = interval_sec
+        self.max_depth = max_depth
+        self._target_id = threading.get_ident()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._idle = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._t0 = 0.0
+        self._t1 = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        self._t0 = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sift-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "SamplingProfiler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._t1 = time.perf_counter()
+        return self
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            frame = sys._current_frames().get(self._target_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self._samples += 1
+            # 이벤트 루프가 select에서 대기 중이면 CPU를 쓰지 않는 상태
+            if stack and stack[0].startswith("selectors.py:select"):
+                self._idle += 1
+                continue
+            self._stacks[";".join(reversed(stack))] += 1
+
+    def result(self, top: int = 20) -> dict:
+        busy = self._samples - self._idle
+        self_time: Counter = Counter()
+        for stack, n in self._stacks.items():
+            self_time[stack.rsplit(";", 1)[-1]] += n
+        return {
+            "interval_ms": self.interval_sec * 1000,
+            "wall_ms": int((self._t1 - self._t0) * 1000),
+            "samples": self._samples,
+            "busy_samples": busy,
+            "busy_ms_est": round(busy * self.interval_sec * 1000, 1),
+            "top_self": [{"frame": k, "samples": v} for k, v in self_time.most_common(top)],
+            "top_stacks": [{"stack": k, "samples": v} for k, v in self._stacks.most_common(top)],
+        }
+
+
+@contextmanager
+def maybe_profile(enabled: bool):
+    if not enabled:
+        yield None
+        return
+    prof = SamplingProfiler().start()
+    try:
+        yield prof
+    finally:
+        prof.stop()
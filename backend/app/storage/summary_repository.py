@@ -0,0 +1,428 @@
+# summary_repository.py
+"""
+요약 결과 저장소입니다. (로컬: SQLite, 운영: Oracle 예정)
+문서 해시 + 모델 + 모드 + 옵션이 같은 요약이 이미 있으면 LLM을 다시 돌리지 않고 바로 꺼내 쓰고,
+이력 조회/검색 API에서 keyset 페이지네이션으로 목록을 제공합니다.
+
+- 저장은 요청 경로 밖에서: SummaryWriter가 큐에 모아 배치로 insert
+- map 청크 요약도 청크 해시로 저장해, 수정된 문서는 바뀐 청크만 다시 요약
+- 조회는 작은 커넥션 풀에서 꺼낸 커넥션으로 스레드에서 실행
+- 백엔드 교체: SummaryRepository를 상속하고 register_backend("oracle", ...)로 등록하는 모듈을
+  SIFT_SUMMARY_DB_BACKENDS(쉼표 구분 모듈 경로)에 넣으면, lifespan에서 저장소를 열 때 먼저 import함
+"""
+
+import asyncio
+import importlib
+import json
+import logging
+import queue
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Type
+
+from app.core.config import SUMMARY_DB_URL, SUMMARY_DB_POOL_SIZE, SUMMARY_DB_BACKENDS
+
+logger = logging.getLogger(__name__)
+
+
+class SummaryRepository(ABC):
+    """저장소 인터페이스. 구현체는 아래 메서드를 모두 제공해야 한다."""
+
+    @abstractmethod
+    def open(self) -> None:
+        ...
+
+    @abstractmethod
+    def close(self) -> None:
+        ...
+
+    @abstractmethod
+    def insert_many(self, rows: List[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def find_latest(self, doc_hash: str, model: str, mode: str, options_hash: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def get(self, summary_id: int) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def insert_chunk_summaries(self, rows: List[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def find_chunk_summaries(self, model: str, options_hash: str, chunk_hashes: List[str]) -> Dict[str, str]:
+        ...
+
+    @abstractmethod
+    def list(
+        self,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        model: Optional[str] = None,
+        mode: Optional[str] = None,
+        doc_hash: Optional[str] = None,
+        q: Optional[str] = None,
+    ) -> dict:
+        ...
+
+
+# ── SQLite 구현 ──────────────────────────────────────────────────────────
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_hash     TEXT    NOT NULL,
+    filename     TEXT,
+    model        TEXT    NOT NULL,
+    served_by    TEXT,
+    mode         TEXT    NOT NULL,
+    options      TEXT    NOT NULL,
+    options_hash TEXT    NOT NULL,
+    summary      TEXT    NOT NULL,
+    bullets      TEXT    NOT NULL,
+    done_reason  TEXT,
+    extract      TEXT,
+    elapsed_ms   INTEGER,
+    created_at   REAL    NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_hash    ON summaries (doc_hash, model, mode, options_hash, created_at);
+CREATE INDEX IF NOT EXISTS idx_summaries_model   ON summaries (model, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_summaries_created ON summaries (created_at, id);
+
+-- map 청크 요약 (증분 재요약용, 청크 내용 해시로 조회)
+CREATE TABLE IF NOT EXISTS chunk_summaries (
+    chunk_hash   TEXT NOT NULL,
+    model        TEXT NOT NULL,
+    options_hash TEXT NOT NULL,
+    summary      TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    PRIMARY KEY (chunk_hash, model, options_hash)
+);
+"""
+
+# 기존 DB 파일에 나중에 추가된 컬럼 (open 시 없으면 ALTER TABLE)
+_ADDED_COLUMNS = (
+    ("summaries", "served_by", "TEXT"),  # 캐스케이드에서 실제로 요약한 모델 (model은 요청된 모델)
+)
+
+_COLUMNS = (
+    "doc_hash", "filename", "model", "served_by", "mode", "options", "options_hash",
+    "summary", "bullets", "done_reason", "extract", "elapsed_ms", "created_at",
+)
+_JSON_COLUMNS = ("options", "bullets", "extract")
+
+
+class _ConnectionPool:
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+        self._opened = False
+
+    def open(self) -> None:
+        self._opened = True
+        for _ in range(self.size):
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        # open() 전에 꺼내려 하면 영원히 기다리게 되므로 바로 실패
+        if not self._opened:
+            raise RuntimeError("Summary DB pool is not open (app lifespan not started?)")
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def close(self) -> None:
+        self._opened = False
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+def _row_to_dict(row: sqlite3.Row) -> dict:
+    d = dict(row)
+    for k in _JSON_COLUMNS:
+        if d.get(k) is not None:
+            d[k] = json.loads(d[k])
+    return d
+
+
+def _encode_cursor(row: dict) -> str:
+    return f"{row['created_at']!r}:{row['id']}"
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    created_at, _, sid = cursor.rpartition(":")
+    return float(created_at), int(sid)
+
+
+class SQLiteSummaryRepository(SummaryRepository):
+    def __init__(self, path: str, pool_size: int = 4):
+        self.path = path
+        self._pool = _ConnectionPool(path, pool_size)
+
+    def open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._pool.open()
+        with self._pool.connection() as conn:
+            conn.executescript(_SCHEMA)
+            for table, column, decl in _ADDED_COLUMNS:
+                existing = {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def insert_many(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        params = [
+            tuple(
+                json.dumps(r.get(c), ensure_ascii=False) if c in _JSON_COLUMNS else r.get(c)
+                for c in _COLUMNS
+            )
+            for r in rows
+        ]
+        sql = f"INSERT INTO summaries ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})"
+        with self._pool.connection() as conn:
+            with conn:
+                conn.executemany(sql, params)
+
+    def find_latest(self, doc_hash: str, model: str, mode: str, options_hash: str) -> Optional[dict]:
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT * FROM summaries WHERE doc_hash = ? AND model = ? AND mode = ? AND options_hash = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (doc_hash, model, mode, options_hash),
+            ).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def get(self, summary_id: int) -> Optional[dict]:
+        with self._pool.connection() as conn:
+            row = conn.execute("SELECT * FROM summaries WHERE id = ?", (summary_id,)).fetchone()
+        return _row_to_dict(row) if row else None
+
+    def insert_chunk_summaries(self, rows: List[dict]) -> None:
+        if not rows:
+            return
+        params = [(r["chunk_hash"], r["model"], r["options_hash"], r["summary"], r["created_at"]) for r in rows]
+        with self._pool.connection() as conn:
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_summaries (chunk_hash, model, options_hash, summary, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    params,
+                )
+
+    def find_chunk_summaries(self, model: str, options_hash: str, chunk_hashes: List[str]) -> Dict[str, str]:
+        if not chunk_hashes:
+            return {}
+        marks = ", ".join("?" for _ in chunk_hashes)
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT chunk_hash, summary FROM chunk_summaries "
+                f"WHERE model = ? AND options_hash = ? AND chunk_hash IN ({marks})",
+                (model, options_hash, *chunk_hashes),
+            ).fetchall()
+        return {r["chunk_hash"]: r["summary"] for r in rows}
+
+    def list(self, limit=20, cursor=None, model=None, mode=None, doc_hash=None, q=None) -> dict:
+        where, args = [], []
+        if model:
+            where.append("model = ?")
+            args.append(model)
+        if mode:
+            where.append("mode = ?")
+            args.append(mode)
+        if doc_hash:
+            where.append("doc_hash = ?")
+            args.append(doc_hash)
+        if q:
+            where.append("(summary LIKE ? OR filename LIKE ?)")
+            args += [f"%{q}%", f"%{q}%"]
+        if cursor:
+            # keyset: 마지막으로 본 (created_at, id)보다 이전 것들
+            created_at, sid = _decode_cursor(cursor)
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            args += [created_at, created_at, sid]
+
+        sql = "SELECT * FROM summaries"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        args.append(limit + 1)
+
+        with self._pool.connection() as conn:
+            rows = [_row_to_dict(r) for r in conn.execute(sql, args).fetchall()]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "items": rows,
+            "next_cursor": _encode_cursor(rows[-1]) if has_more and rows else None,
+        }
+
+
+# ── 백엔드 선택 ─────────────────────────────────────────────────────────
+_BACKENDS: Dict[str, Type[SummaryRepository]] = {"sqlite": SQLiteSummaryRepository}
+
+
+def register_backend(scheme: str, cls: Type[SummaryRepository]) -> None:
+    _BACKENDS[scheme] = cls
+
+
+def load_backends(modules: Tuple[str, ...] = SUMMARY_DB_BACKENDS) -> None:
+    """플러그인 모듈 import (모듈이 import 시점에 register_backend를 호출)"""
+    for name in modules:
+        importlib.import_module(name)
+
+
+def create_repository(url: str, pool_size: int = 4) -> SummaryRepository:
+    # 예) sqlite:///home/app/data/summaries.db, oracle://user@host:1521/service
+    scheme, _, rest = url.partition("://")
+    if scheme not in _BACKENDS:
+        raise ValueError(f"Unsupported summary DB backend: {scheme} (registered: {sorted(_BACKENDS)})")
+    return _BACKENDS[scheme](rest, pool_size)
+
+
+class LazySummaryRepository(SummaryRepository):
+    """
+    모듈 import 시점이 아니라 open()(lifespan)에서 실제 백엔드를 만든다.
+    그래야 플러그인 백엔드가 등록된 뒤에 URL의 scheme을 해석할 수 있다.
+    """
+
+    def __init__(self, url: str, pool_size: int = 4):
+        self.url = url
+        self.pool_size = pool_size
+        self._repo: Optional[SummaryRepository] = None
+
+    @property
+    def repo(self) -> SummaryRepository:
+        if self._repo is None:
+            raise RuntimeError("Summary repository is not open (app lifespan not started?)")
+        return self._repo
+
+    def open(self) -> None:
+        if self._repo is None:
+            load_backends()
+            self._repo = create_repository(self.url, self.pool_size)
+        self._repo.open()
+
+    def close(self) -> None:
+        if self._repo is not None:
+            self._repo.close()
+            self._repo = None
+
+    def insert_many(self, rows: List[dict]) -> None:
+        self.repo.insert_many(rows)
+
+    def find_latest(self, doc_hash: str, model: str, mode: str, options_hash: str) -> Optional[dict]:
+        return self.repo.find_latest(doc_hash, model, mode, options_hash)
+
+    def get(self, summary_id: int) -> Optional[dict]:
+        return self.repo.get(summary_id)
+
+    def insert_chunk_summaries(self, rows: List[dict]) -> None:
+        self.repo.insert_chunk_summaries(rows)
+
+    def find_chunk_summaries(self, model: str, options_hash: str, chunk_hashes: List[str]) -> Dict[str, str]:
+        return self.repo.find_chunk_summaries(model, options_hash, chunk_hashes)
+
+    def list(self, limit=20, cursor=None, model=None, mode=None, doc_hash=None, q=None) -> dict:
+        return self.repo.list(limit=limit, cursor=cursor, model=model, mode=mode, doc_hash=doc_hash, q=q)
+
+
+# ── 배치 writer ─────────────────────────────────────────────────────────
+class SummaryWriter:
+    """요청 경로에서는 큐에 넣기만 하고, 백그라운드 태스크가 모아서 종류별로 배치 insert."""
+
+    def __init__(self, repo: SummaryRepository, batch_size: int = 32, flush_interval_sec: float = 0.5):
+        self.repo = repo
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, row: dict) -> None:
+        self._put("summary", row)
+
+    def submit_chunk(self, row: dict) -> None:
+        self._put("chunk", row)
+
+    def _put(self, kind: str, row: dict) -> None:
+        if self._queue is None:
+            return
+        row.setdefault("created_at", time.time())
+        self._queue.put_nowait((kind, row))
+
+    async def _run(self) -> None:
+        # None은 종료 신호: 모아둔 배치를 기록하고 끝낸다
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            batch, stopping = [item], False
+            deadline = time.monotonic() + self.flush_interval_sec
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[tuple]) -> None:
+        writers = {"summary": self.repo.insert_many, "chunk": self.repo.insert_chunk_summaries}
+        for kind, write in writers.items():
+            rows = [row for k, row in batch if k == kind]
+            if not rows:
+                continue
+            try:
+                await asyncio.to_thread(write, rows)
+                self.written += len(rows)
+            except Exception:
+                self.failed += len(rows)
+                logger.exception("failed to write %d %s rows", len(rows), kind)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+
+summary_repo = LazySummaryRepository(SUMMARY_DB_URL, SUMMARY_DB_POOL_SIZE)
+summary_writer = SummaryWriter(summary_repo)
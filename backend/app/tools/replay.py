@@ -0,0 +1,220 @@
+# replay.py
+"""
+녹화된 Ollama 호출(app.services.ollama_recorder)을 다른 백엔드/모델/옵션으로 다시 보내고,
+원본과 재생 결과의 지연/토큰 수를 stage별로 나란히 비교합니다.
+새 모델이나 num_batch/num_ctx 설정을 배포 전에 실제 트래픽 분포로 검증할 때 사용합니다.
+
+사용 예:
+    python -m app.tools.replay data/recordings/*.jsonl.gz --model gemma3:1b --option num_batch=512
+    python -m app.tools.replay rec.jsonl.gz --base-url http://gpu2:11434 --speed 2 --out report.json
+
+--speed 1은 원래 도착 간격 그대로, 2는 두 배 빠르게, 0은 간격 없이(동시성 한도까지) 보냅니다.
+프롬프트 원문 없이(해시만) 녹화된 항목은 재생할 수 없어 건너뜁니다.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import math
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from app.core.config import OLLAMA_BASE_URL
+from app.services.ollama_client import pick_ollama_metrics
+
+
+def load_records(paths: List[str], stage: Optional[str] = None, limit: Optional[int] = None) -> Tuple[List[dict], int]:
+    records, skipped = [], 0
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        lines = []
+        with opener(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    lines.append(line)
+            except EOFError:
+                # 기록 중 프로세스가 죽어 gzip 끝 표시가 없는 파일: 읽은 데까지만 사용
+                print(f"warning: {path} is truncated, using {len(lines)} complete lines", file=sys.stderr)
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # 잘린 마지막 줄
+                continue
+            if stage and rec.get("stage") != stage:
+                continue
+            if not rec.get("prompt"):
+                skipped += 1
+                continue
+            records.append(rec)
+    records.sort(key=lambda r: r["ts"])
+    if limit:
+        records = records[:limit]
+    return records, skipped
+
+
+def parse_option(s: str) -> Tuple[str, object]:
+    key, sep, raw = s.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"option must be key=value: {s}")
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+async def replay(
+    records: List[dict],
+    base_url: str,
+    model: Optional[str],
+    options: Dict[str, object],
+    speed: float,
+    concurrency: int,
+    timeout_sec: float,
+) -> List[dict]:
+    if not records:
+        return []
+    t_first = records[0]["ts"]
+    sem = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=base_url,
+        timeout=httpx.Timeout(timeout_sec),
+        limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+    ) as client:
+        start = time.perf_counter()
+
+        async def one(rec: dict) -> dict:
+            # 원래 도착 시각(녹화 기준)에 맞춰 대기
+            if speed > 0:
+                delay = (rec["ts"] - t_first) / speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            payload = {
+                "model": model or rec["model"],
+                "prompt": rec["prompt"],
+                "stream": False,
+                "keep_alive": rec.get("keep_alive") or "30m",
+                "options": {**(rec.get("options") or {}), **options},
+            }
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post("/api/generate", json=payload)
+                    r.raise_for_status()
+                    metrics = pick_ollama_metrics(r.json())
+                    error = None
+                except httpx.HTTPError as e:
+                    metrics, error = {}, f"{type(e).__name__}: {e}"
+                wall_ms = (time.perf_counter() - t0) * 1000
+            return {"stage": rec.get("stage"), "wall_ms": wall_ms, "metrics": metrics, "error": error}
+
+        return await asyncio.gather(*(one(r) for r in records))
+
+
+def _dist(values: List[float]) -> dict:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {"n": 0, "mean": None, "p50": None, "p95": None}
+
+    def q(p):
+        return values[min(len(values) - 1, max(0, math.ceil(p * len(values)) - 1))]
+
+    return {"n": len(values), "mean": round(sum(values) / len(values), 1), "p50": q(0.5), "p95": q(0.95)}
+
+
+def _side(wall: List[float], metrics: List[dict]) -> dict:
+    return {
+        "wall_ms": _dist(wall),
+        "prompt_eval_count": _dist([m.get("prompt_eval_count") for m in metrics]),
+        "eval_count": _dist([m.get("eval_count") for m in metrics]),
+        "tok_per_sec": _dist([m.get("tok_per_sec") for m in metrics]),
+        "length_rate": round(
+            sum(1 for m in metrics if m.get("done_reason") == "length") / max(1, len(metrics)), 3
+        ),
+    }
+
+
+def compare(records: List[dict], results: List[dict]) -> dict:
+    groups: Dict[str, Tuple[List[dict], List[dict]]] = {}
+    for rec, res in zip(records, results):
+        for key in ("(all)", rec.get("stage") or "(none)"):
+            groups.setdefault(key, ([], []))
+            groups[key][0].append(rec)
+            groups[key][1].append(res)
+
+    report = {}
+    for key, (recs, ress) in groups.items():
+        ok = [r for r in ress if r["error"] is None]
+        report[key] = {
+            "original": _side([r.get("wall_ms") for r in recs], [r.get("metrics") or {} for r in recs]),
+            "replay": _side([r["wall_ms"] for r in ok], [r["metrics"] for r in ok]),
+            "errors": len(ress) - len(ok),
+        }
+    return report
+
+
+def print_report(report: dict, out=sys.stdout) -> None:
+    rows = [
+        ("wall_ms p50", "wall_ms", "p50"),
+        ("wall_ms p95", "wall_ms", "p95"),
+        ("prompt_eval_count mean", "prompt_eval_count", "mean"),
+        ("eval_count mean", "eval_count", "mean"),
+        ("tok_per_sec p50", "tok_per_sec", "p50"),
+    ]
+    for stage, r in report.items():
+        n = r["original"]["wall_ms"]["n"]
+        print(f"\n[{stage}] calls={n} errors={r['errors']}", file=out)
+        print(f"  {'metric':<24}{'original':>12}{'replay':>12}", file=out)
+        for label, metric, stat in rows:
+            a = r["original"][metric][stat]
+            b = r["replay"][metric][stat]
+            print(f"  {label:<24}{_fmt(a):>12}{_fmt(b):>12}", file=out)
+        print(f"  {'length_rate':<24}{r['original']['length_rate']:>12}{r['replay']['length_rate']:>12}", file=out)
+
+
+def _fmt(v) -> str:
+    if v is None:
+        return "-"
+    return f"{v:.1f}" if isinstance(v, float) else str(v)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.tools.replay", description="Replay recorded Ollama calls.")
+    ap.add_argument("files", nargs="+", help="recording files (.jsonl or .jsonl.gz)")
+    ap.add_argument("--base-url", default=OLLAMA_BASE_URL)
+    ap.add_argument("--model", help="override model for every call")
+    ap.add_argument("--option", action="append", type=parse_option, default=[],
+                    help="override generation option, e.g. num_ctx=4096 (repeatable)")
+    ap.add_argument("--speed", type=float, default=1.0, help="arrival rate multiplier (0 = no pacing)")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--timeout", type=float, default=300)
+    ap.add_argument("--stage", help="replay only this stage")
+    ap.add_argument("--limit", type=int)
+    ap.add_argument("--out", help="write JSON report to this path")
+    args = ap.parse_args(argv)
+
+    records, skipped = load_records(args.files, stage=args.stage, limit=args.limit)
+    print(f"loaded {len(records)} calls (skipped {skipped} without prompt text)")
+    if not records:
+        return 1
+
+    results = asyncio.run(replay(
+        records, args.base_url, args.model, dict(args.option), args.speed, args.concurrency, args.timeout,
+    ))
+    report = compare(records, results)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "report": report}, f, ensure_ascii=False, indent=2, default=str)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())